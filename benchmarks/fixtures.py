@@ -0,0 +1,94 @@
+import cv2
+import logging
+import numpy as np
+import os
+import pandas as pd
+from scipy.io import wavfile
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Words used to build the synthetic transcriptions
+WORDS = ['me', 'gusta', 'mucho', 'este', 'producto', 'pero', 'no', 'lo', 'recomiendo', 'porque', 'es', 'muy',
+         'caro', 'la', 'crema', 'huele', 'bien', 'y', 'deja', 'la', 'piel', 'suave', 'aunque', 'tarda', 'en',
+         'secarse', 'el', 'maquillaje', 'dura', 'todo', 'día', 'sin', 'problemas', 'nunca', 'más']
+
+
+def video(file, frames=90, width=320, height=240, fps=30, seed=0):
+    """
+        Write a synthetic MP4 video: a face-like pattern moving over a noisy background.
+        The same arguments always produce the same frames.
+
+        :return: path of the video
+    """
+    rng = np.random.RandomState(seed)
+    background = rng.randint(0, 255, (height, width, 3)).astype(np.uint8)
+    writer = cv2.VideoWriter(file, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    size = max(min(width, height) // 4, 8)
+    for index in range(frames):
+        frame = background.copy()
+        x = int((width - size) * (0.5 + 0.4 * np.sin(2 * np.pi * index / max(frames, 1))))
+        y = (height - size) // 2
+        center = (x + size // 2, y + size // 2)
+        cv2.ellipse(frame, center, (size // 2, int(size * 0.6)), 0, 0, 360, (170, 190, 220), -1)
+        for dx in (-size // 5, size // 5):
+            cv2.circle(frame, (center[0] + dx, center[1] - size // 6), max(size // 12, 1), (40, 40, 40), -1)
+        cv2.line(frame, (center[0] - size // 6, center[1] + size // 5), (center[0] + size // 6, center[1] + size // 5),
+                 (60, 40, 120), max(size // 20, 1))
+        writer.write(frame)
+    writer.release()
+    return file
+
+
+def signal(seconds, fs=16000, seed=0):
+    """Synthetic speech-like signal: harmonics of a varying pitch modulated by syllables, plus noise"""
+    rng = np.random.RandomState(seed)
+    t = np.arange(int(seconds * fs)) / fs
+    pitch = 120 + 40 * np.sin(2 * np.pi * 0.7 * t + seed)
+    phase = 2 * np.pi * np.cumsum(pitch) / fs
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    syllables = 0.5 * (1 + np.sin(2 * np.pi * 4 * t + seed)) ** 2
+    x = 6000 * voice * syllables + 300 * rng.randn(len(t))
+    return np.clip(x, -32768, 32767).astype(np.int16)
+
+
+def wav(file, seconds=3.0, fs=16000, seed=0):
+    """Write a synthetic WAV file and return its path"""
+    wavfile.write(file, fs, signal(seconds, fs, seed))
+    return file
+
+
+def transcription(count, seed=0):
+    """Synthetic Spanish transcriptions, one per utterance"""
+    rng = np.random.RandomState(seed)
+    return [' '.join(rng.choice(WORDS, rng.randint(5, 20))) for _ in range(count)]
+
+
+def session(directory, utterances=10, seconds=3.0, frames_per_second=30, width=320, height=240, fs=16000, seed=0,
+            with_video=True):
+    """
+        Write every source of a synthetic analysis in a directory:
+
+        - bounds.csv with #starttime, #endtime and transcription of each utterance
+        - audio/<i>.wav with one WAV file per utterance
+        - session.wav with every utterance
+        - video.mp4 with the whole session, if with_video
+
+        :return: dictionary with the path of each source
+    """
+    os.makedirs(os.path.join(directory, 'audio'), exist_ok=True)
+    starts = np.arange(utterances) * seconds
+    bounds = pd.DataFrame({'#starttime': starts, '#endtime': starts + seconds,
+                           'transcription': transcription(utterances, seed)})
+    bounds.to_csv(os.path.join(directory, 'bounds.csv'), sep=';', index=False)
+    audio = [wav(os.path.join(directory, 'audio', '{:04d}.wav'.format(i)), seconds, fs, seed + i)
+             for i in range(utterances)]
+    wavfile.write(os.path.join(directory, 'session.wav'), fs,
+                  np.concatenate([signal(seconds, fs, seed + i) for i in range(utterances)]))
+    sources = {'bounds': os.path.join(directory, 'bounds.csv'), 'audio': audio,
+               'session': os.path.join(directory, 'session.wav'), 'video': None}
+    if with_video:
+        sources['video'] = video(os.path.join(directory, 'video.mp4'), int(utterances * seconds * frames_per_second),
+                                 width, height, frames_per_second, seed)
+    logger.info('Fixtures with {} utterances written to {}'.format(utterances, directory))
+    return sources
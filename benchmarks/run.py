@@ -0,0 +1,300 @@
+import argparse
+import json
+import logging
+import numpy as np
+import os
+import pandas as pd
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from collections import OrderedDict
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fixtures
+from multimodal.selector import Selector
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
+logger = logging.getLogger(__name__ if __name__ != '__main__' else 'benchmarks')
+
+CLASSIFIER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'multimodal', 'models', 'haarcascade_frontalface_default.xml')
+EMOTIONS = ['anger', 'happiness', 'calm']
+
+# Sizes of the fixtures of each benchmark suite
+SIZES = {
+    'small': {'frames': [30], 'resolutions': [(320, 240)], 'utterances': [5], 'crops': 32},
+    'medium': {'frames': [90, 300], 'resolutions': [(320, 240), (640, 480)], 'utterances': [10, 50], 'crops': 128},
+    'large': {'frames': [300, 900], 'resolutions': [(640, 480), (1280, 720)], 'utterances': [50, 200], 'crops': 512}
+}
+
+
+def measure(function, items, repeat=1, memory=True):
+    """
+        Time a function and measure the peak of the memory it allocates.
+
+        :param function: function without arguments to benchmark
+        :param items: number of items (frames, utterances...) processed by each call
+        :param repeat: number of timed calls, the fastest one is reported
+        :param memory: if true, the function is called once more while tracing allocations
+        :return: dictionary with the timings, items per second and peak memory in bytes
+    """
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    peak = None
+    if memory:
+        # Tracing slows allocations down, so it is not done on the timed calls
+        tracemalloc.start()
+        try:
+            function()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    best = min(times)
+    return {'seconds': best, 'mean_seconds': sum(times) / len(times), 'items': items,
+            'per_second': items / best if best > 0 else None, 'peak_memory': peak}
+
+
+def frames(file, count=None):
+    """Decoded frames of a video"""
+    import cv2
+    video = cv2.VideoCapture(file)
+    images = []
+    while count is None or len(images) < count:
+        success, frame = video.read()
+        if not success:
+            break
+        images.append(frame)
+    video.release()
+    return images
+
+
+def video_file(directory, count, width, height):
+    file = os.path.join(directory, 'video_{}_{}x{}.mp4'.format(count, width, height))
+    if not os.path.isfile(file):
+        fixtures.video(file, count, width, height)
+    return file
+
+
+def session(directory, utterances):
+    path = os.path.join(directory, 'session_{}'.format(utterances))
+    if os.path.isfile(os.path.join(path, 'bounds.csv')):
+        return {'bounds': os.path.join(path, 'bounds.csv'), 'session': os.path.join(path, 'session.wav'),
+                'audio': sorted(os.path.join(path, 'audio', file) for file in os.listdir(os.path.join(path, 'audio')))}
+    return fixtures.session(path, utterances, with_video=False)
+
+
+def bench_faces(size, directory, options):
+    from multimodal.video import ImageAnalyzer
+    analyzer = ImageAnalyzer(CLASSIFIER)
+    count = max(size['frames'])
+    for width, height in size['resolutions']:
+        gray = [analyzer.toGray(frame) for frame in frames(video_file(directory, count, width, height))]
+        for scale in (1.0, 0.5):
+            result = measure(lambda: [analyzer.faces(image, scale=scale) for image in gray], len(gray),
+                             options['repeat'])
+            yield dict(result, params={'resolution': '{}x{}'.format(width, height), 'detection_scale': scale},
+                       unit='frames')
+
+
+def bench_fer(size, directory, options):
+    from multimodal.fermodel import FERModel
+    model = FERModel(EMOTIONS, verbose=False)
+    rng = np.random.RandomState(0)
+    crops = [rng.randint(0, 255, (96, 96, 3)).astype(np.uint8) for _ in range(size['crops'])]
+    result = measure(lambda: [model.predict(crop) for crop in crops], len(crops), options['repeat'])
+    yield dict(result, params={'method': 'predict'}, unit='frames')
+    result = measure(lambda: model.predict_batch(crops), len(crops), options['repeat'])
+    yield dict(result, params={'method': 'predict_batch'}, unit='frames')
+
+
+def bench_video(size, directory, options):
+    from multimodal.video import VideoAnalyzer
+    for count in size['frames']:
+        for width, height in size['resolutions']:
+            file = video_file(directory, count, width, height)
+
+            def analyze():
+                VideoAnalyzer(CLASSIFIER, file, EMOTIONS, verbose=False, threads=options['threads']).analyze()
+
+            result = measure(analyze, count, options['repeat'])
+            yield dict(result, params={'frames': count, 'resolution': '{}x{}'.format(width, height),
+                                       'threads': options['threads']}, unit='frames')
+
+
+def bench_audio(size, directory, options):
+    from multimodal.features import AudioFeatures
+    for utterances in size['utterances']:
+        files = session(directory, utterances)['audio']
+        for extractor in AudioFeatures.EXTRACTORS:
+            features = AudioFeatures(extractor=extractor, verbose=False)
+            result = measure(lambda: [features.run(file) for file in files], len(files), options['repeat'])
+            yield dict(result, params={'utterances': utterances, 'extractor': extractor}, unit='utterances')
+
+
+def bench_audio_session(size, directory, options):
+    from multimodal.features import AudioFeatures
+    for utterances in size['utterances']:
+        sources = session(directory, utterances)
+        bounds = pd.read_csv(sources['bounds'], sep=';')
+        features = AudioFeatures(verbose=False)
+        result = measure(lambda: features.run_segments(sources['session'], bounds['#starttime'], bounds['#endtime']),
+                         utterances, options['repeat'])
+        yield dict(result, params={'utterances': utterances}, unit='utterances')
+
+
+def bench_tokenizer(size, directory, options):
+    from multimodal.utils import custom_tokenizer
+    for utterances in size['utterances']:
+        texts = fixtures.transcription(utterances)
+        result = measure(lambda: [custom_tokenizer(text) for text in texts], utterances, options['repeat'])
+        yield dict(result, params={'utterances': utterances}, unit='utterances')
+
+
+def per_frame(count, fps=30, seed=0):
+    """Synthetic per-frame emotions as computed by VideoFeatures"""
+    rng = np.random.RandomState(seed)
+    df = pd.DataFrame(rng.dirichlet(np.ones(3), count), columns=EMOTIONS)
+    df['timestamp'] = np.arange(count) / fps
+    return df
+
+
+def bench_synchronize(size, directory, options):
+    from multimodal.features import VideoFeatures
+    for utterances in size['utterances']:
+        df = per_frame(utterances * 90)
+        starts, ends = np.arange(utterances) * 3.0, np.arange(1, utterances + 1) * 3.0
+        synchronizer = VideoFeatures()
+        result = measure(lambda: VideoFeatures.synchronize_all(df, starts, ends), utterances, options['repeat'])
+        yield dict(result, params={'utterances': utterances, 'method': 'synchronize_all'}, unit='utterances')
+        result = measure(lambda: [synchronizer.synchronize(df, start, end) for start, end in zip(starts, ends)],
+                         utterances, options['repeat'])
+        yield dict(result, params={'utterances': utterances, 'method': 'synchronize'}, unit='utterances')
+
+
+def modalities(utterances, seed=0):
+    """Synthetic features of each modality, with the columns computed by MultimodalFeatures"""
+    rng = np.random.RandomState(seed)
+    text = pd.Series(fixtures.transcription(utterances, seed), name='transcription')
+    audio = pd.DataFrame(rng.randn(utterances, len(Selector.AUDIO_COLUMNS)), columns=Selector.AUDIO_COLUMNS)
+    video = pd.DataFrame(rng.dirichlet(np.ones(3), utterances), columns=Selector.VIDEO_COLUMNS)
+    video.insert(0, 'end', np.arange(1, utterances + 1) * 3.0)
+    video.insert(0, 'start', np.arange(utterances) * 3.0)
+    return {'text': text, 'audio': audio, 'video': video}
+
+
+def bench_analyzers(size, directory, options):
+    from multimodal import analyzer
+    for utterances in size['utterances']:
+        features = modalities(utterances)
+        functions = OrderedDict([
+            ('text_batch_analyzer', lambda: analyzer.text_batch_analyzer(features['text'])),
+            ('audio_batch_analyzer', lambda: analyzer.audio_batch_analyzer(features['audio'])),
+            ('video_batch_analyzer', lambda: analyzer.video_batch_analyzer(features['video'].drop(columns=['start', 'end'])))
+        ])
+        for mods in (('text', 'audio'), ('audio', 'video'), ('video', 'text')):
+            ft = pd.concat([features[modality] for modality in mods], axis=1)
+            functions['bimodal_analyzer ' + ' + '.join(mods)] = lambda ft=ft, mods=mods: analyzer.bimodal_analyzer(ft, mods)
+        ft = pd.concat([features['text'], features['audio'], features['video']], axis=1)
+        functions['multimodal'] = lambda: analyzer.multimodal(ft)
+        for name, function in functions.items():
+            try:
+                result = measure(function, utterances, options['repeat'])
+            except Exception as e:
+                logger.warning('Benchmark of {} failed: {}'.format(name, e))
+                result = {'error': str(e)}
+            yield dict(result, params={'utterances': utterances, 'function': name}, unit='utterances')
+
+
+BENCHMARKS = OrderedDict([
+    ('faces', bench_faces),
+    ('fer', bench_fer),
+    ('video', bench_video),
+    ('audio', bench_audio),
+    ('audio_session', bench_audio_session),
+    ('tokenizer', bench_tokenizer),
+    ('synchronize', bench_synchronize),
+    ('analyzers', bench_analyzers)
+])
+
+
+def commit():
+    """Current commit of the repository, if any"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except Exception:
+        return None
+
+
+def run(size='small', benchmarks=None, directory=None, repeat=1, threads=1):
+    """
+        Run the benchmarks on fixtures of the given size.
+
+        :param size: name of the sizes in SIZES
+        :param benchmarks: names of the benchmarks to run, all of them by default
+        :param directory: directory where fixtures are written and reused, a temporary one by default
+        :param repeat: number of timed runs of each benchmark
+        :param threads: threads option of the VideoAnalyzer
+        :return: dictionary with the environment and the results of each benchmark
+    """
+    temporary = directory is None
+    directory = tempfile.mkdtemp(prefix='multimodal-benchmarks-') if temporary else directory
+    os.makedirs(directory, exist_ok=True)
+    options = {'repeat': repeat, 'threads': threads}
+    results = []
+    try:
+        for name in benchmarks or BENCHMARKS:
+            logger.info('Running benchmark {}...'.format(name))
+            try:
+                for result in BENCHMARKS[name](SIZES[size], directory, options):
+                    results.append(dict(result, benchmark=name))
+            except Exception as e:
+                # Missing backends (e.g. TensorFlow) only skip their own benchmarks
+                logger.warning('Benchmark {} failed: {}'.format(name, e))
+                results.append({'benchmark': name, 'error': str(e)})
+    finally:
+        if temporary:
+            shutil.rmtree(directory, ignore_errors=True)
+    return {
+        'commit': commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'size': size,
+        'repeat': repeat,
+        # Peak resident memory of the whole process, in bytes
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024),
+        'results': results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark each stage of the analysis on synthetic fixtures')
+    parser.add_argument('--size', help='Size of the fixtures (default: small)', choices=sorted(SIZES), default='small')
+    parser.add_argument('--benchmarks', help='Benchmarks to run (default: all)', nargs='+', choices=list(BENCHMARKS))
+    parser.add_argument('--directory', help='Directory where fixtures are written and reused (default: a temporary one)')
+    parser.add_argument('--repeat', help='Number of timed runs of each benchmark (default: 3)', type=int, default=3)
+    parser.add_argument('--threads', help='Threads option of the VideoAnalyzer (default: 1)', type=int, default=1)
+    parser.add_argument('--output', help='JSON file with the results (default: standard output)')
+    args = parser.parse_args()
+
+    report = run(args.size, args.benchmarks, args.directory, args.repeat, args.threads)
+    data = json.dumps(report, indent=2)
+    if args.output is not None:
+        with open(args.output, 'w') as stream:
+            stream.write(data + '\n')
+        logger.info('Results saved to {}'.format(args.output))
+    else:
+        print(data)
+
+
+if __name__ == '__main__':
+    main()
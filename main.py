@@ -1,9 +1,6 @@
 import argparse
-import glob
 import logging
-import matplotlib.pyplot as plt
 import os
-import pandas as pd
 import yaml
 from multimodal.utils import timer
 from prettytable import PrettyTable
@@ -11,6 +8,8 @@ from prettytable import PrettyTable
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
 logger = logging.getLogger(__name__ if __name__ != '__main__' else 'main')
 
+SOURCES = ['bounds', 'text', 'audio', 'audio_dir', 'video']
+
 
 def main():
     """Define possible options for the CLI."""
@@ -26,12 +25,49 @@ def main():
     parser.add_argument('--audio-dir', help='Directory with the audio files in WAV format', nargs=1)
     parser.add_argument('--video', help='Video file for the analysis in MP4 format', nargs=1)
 
+    parser.add_argument('--warmup', help='Load every pretrained model at startup', action='store_true')
+    parser.add_argument('--mmap', help='Load pretrained models as memory-mapped files', action='store_true')
+    parser.add_argument('--batch-size', help='Number of faces classified together by the FER model (default: 32)',
+                        type=int, default=32)
+    parser.add_argument('--detection-scale', help='Detect faces on frames resized by this factor, e.g. 0.5 (default: 1.0)',
+                        type=float, default=1.0)
+    parser.add_argument('--track-interval', help='Search the whole frame for a face only every N frames and track it in between',
+                        type=int, default=None)
+    parser.add_argument('--offline', help='Fail instead of downloading missing NLTK resources', action='store_true')
+    parser.add_argument('--audio-workers', help='Number of processes used to extract audio features (default: 1)',
+                        type=int, default=1)
+    parser.add_argument('--audio-extractor', help='Short-term audio features extractor: numpy or pyaudioanalysis '
+                        '(default: numpy)', choices=['numpy', 'pyaudioanalysis'], default='numpy')
+    parser.add_argument('--cache-dir', help='Directory of the features cache (default: ~/.cache/multimodal)', default=None)
+    parser.add_argument('--no-cache', help='Do not read or write the features cache', action='store_true')
+    parser.add_argument('--clear-cache', help='Remove every entry of the features cache before the analysis', action='store_true')
+    parser.add_argument('--threads', help='Decode, detect faces and classify them in parallel with this number of '
+                        'detection threads (default: 1)', type=int, default=1)
+    parser.add_argument('--concurrent', help='Analyze text, audio and video at the same time, each one in its own thread',
+                        action='store_true')
+    parser.add_argument('--metrics', help='Save the time spent in each stage to this file, in Prometheus format if '
+                        'its extension is .prom and in JSON otherwise')
+    parser.add_argument('--fps', help='Analyze the video at this frame rate instead of every frame, e.g. 5',
+                        type=float, default=None)
+    parser.add_argument('--fer-threshold', help='Reuse the emotions of the last classified face while the next faces '
+                        'differ from it less than this mean absolute gray level difference, e.g. 2.0', type=float,
+                        default=None)
+    parser.add_argument('--checkpoint', help='Save the features computed so far to this file periodically and resume '
+                        'from it if the analysis was interrupted')
+    parser.add_argument('--checkpoint-interval', help='Seconds between two checkpoints (default: 60)', type=float,
+                        default=60)
+    parser.add_argument('--live', help='Analyze recordings which are still being written and show the results of '
+                        'each utterance as soon as it ends. --audio is a single WAV file with every utterance and '
+                        '--video may also be a device index or a URL', action='store_true')
+    parser.add_argument('--live-timeout', help='Seconds without new frames or samples after which a live source is '
+                        'finished (default: 10)', type=float, default=10)
+
     args = parser.parse_args()
 
     # Error management when using command line
 
-    if args.file is not None and list(vars(args).values()).count(None) != (len(vars(args)) - 1):
-        parser.error('If --file option is used, any other option cannot be used')
+    if args.file is not None and any(getattr(args, source) is not None for source in SOURCES):
+        parser.error('If --file option is used, any other source option cannot be used')
 
     # Load parameters from configuration file
 
@@ -48,108 +84,109 @@ def main():
 
     if args.audio is not None and args.audio_dir is not None:
         parser.error('Cannot use --audio and --audio-dir at the same time')
-    elif (list(vars(args).values()).count(None) != (len(vars(args)) - 1) and
-    (args.audio is not None or args.text is not None) and args.bounds is None):
+    elif (args.audio is not None or args.text is not None) and args.bounds is None:
         parser.error('A bounds file is needed for perform an analysis')
+    elif args.live and args.bounds is None:
+        parser.error('A bounds file is needed for a live analysis')
+    elif args.live and (args.audio_dir is not None or (args.audio is not None and len(args.audio) > 1)):
+        parser.error('A live analysis needs a single audio file with every utterance')
 
     # Fileformat error management
 
     if args.text is not None and os.path.splitext(args.text[0])[1].lower() != '.csv':
         parser.error('File format {} for --text not supported'.format(os.path.splitext(args.text[0])[1]))
-    if args.video is not None and os.path.splitext(args.video[0])[1].lower() != '.mp4':
+    if args.video is not None and not args.live and os.path.splitext(args.video[0])[1].lower() != '.mp4':
         parser.error('File format {} for --video not supported'.format(os.path.splitext(args.video[0])[1]))
     for audio in args.audio or []:
         if args.audio is not None and os.path.splitext(audio)[1].lower() != '.wav':
             parser.error('File format {} for --audio not supported'.format(os.path.splitext(audio)[1]))
 
-    # Run analysis
-    from multimodal import analyzer
-    from multimodal import features
-    results = {}
-
-    if args.bounds is not None:
-        args.bounds = pd.read_csv(args.bounds[0], sep=';')
-
-    if args.audio_dir is not None:
-        args.audio = sorted(glob.glob(os.path.join(args.audio_dir[0], '*.wav')))
-
-    if args.text is not None:
-        # Text analysis
-        logger.info('Computing analysis for text...')
-        with timer('Text analysis', logger.info):
-            args.text = pd.read_csv(args.text[0], sep=';')
-            results['Text'] = [analyzer.text_analyzer(el) for el in args.text.transcription]
-
-    if args.audio is not None:
-        # Audio analysis
-        logger.info('Computing analysis for audio...')
-        args.audio = sorted(args.audio)
-        results['Audio'] = []
-        with timer('Audio analysis', logger.info):
-            for file in args.audio:
-                ft = features.AudioFeatures().run(file)
-                results['Audio'].append(analyzer.audio_analyzer(ft))
+    if args.offline:
+        os.environ['MULTIMODAL_OFFLINE'] = '1'
 
-    if args.video is not None and args.bounds is None:
-        # Video analysis of each frame
-        logger.info('Computing analysis for video...')
-        results['Video'] = []
-        with timer('Video analysis', logger.info):
-            ft = features.VideoFeatures().run(args.video[0])
-            for index, row in ft.iterrows():
-                del row['timestamp']
-                results['Video'].append(analyzer.video_analyzer(row))
-
-    if args.video is not None and args.bounds is not None:
-        # Video analysis synchronized with the other sources
-        logger.info('Computing analysis for video...')
-        results['Video'] = []
-        with timer('Video analysis', logger.info):
-            ft = features.BimodalFeatures(args.bounds).run_video(args.video[0]).video
-            for index, row in ft.iterrows():
-                del row['start']
-                del row['end']
-                results['Video'].append(analyzer.video_analyzer(row))
-
-    if args.text is not None and args.audio is not None:
-        # Text and audio analysis
-        logger.info('Computing analysis using two modalities: text + audio...')
-        with timer('Text + Audio analysis', logger.info):
-            mods = ('text', 'audio')
-            ft = features.BimodalFeatures(args.bounds).run(mods, text=args.text, audio=args.audio)
-            results['Text + Audio'] = analyzer.bimodal_analyzer(ft, mods)
-
-    if args.audio is not None and args.video is not None:
-        # Audio and video analysis
-        logger.info('Computing analysis using two modalities: audio + video...')
-        with timer('Audio + Video analysis', logger.info):
-            mods = ('audio', 'video')
-            ft = features.BimodalFeatures(args.bounds).run(mods, audio=args.audio, video=args.video[0])
-            results['Audio + Video'] = analyzer.bimodal_analyzer(ft, mods)
-
-    if args.video is not None and args.text is not None:
-        # Video and text analysis
-        logger.info('Computing analysis using two modalities: video + text...')
-        with timer('Video + Text analysis', logger.info):
-            mods = ('video', 'text')
-            ft = features.BimodalFeatures(args.bounds).run(mods, video=args.video[0], text=args.text)
-            results['Video + Text'] = analyzer.bimodal_analyzer(ft, mods)
-
-    if args.text is not None and args.audio is not None and args.video is not None:
-        # Multimodal analysis
-        logger.info('Computing analysis using three modalities: text + audio + video...')
-        with timer('Multimodal analysis', logger.info):
-            ft = features.MultimodalFeatures(args.bounds).run(text=args.text, audio=args.audio, video=args.video[0])
-            results['Multimodal'] = analyzer.multimodal(ft)
+    # Run analysis
+    from multimodal import pipeline
+    from multimodal.cache import FeatureCache
+    from multimodal.checkpoint import Checkpoint
+    from multimodal.metrics import metrics
+    from multimodal.registry import registry
+
+    cache = None
+    if not args.no_cache or args.clear_cache:
+        cache = FeatureCache(args.cache_dir)
+        if args.clear_cache:
+            cache.clear()
+        if args.no_cache:
+            cache = None
+
+    if args.mmap:
+        registry.mmap_mode = 'r'
+
+    if args.warmup:
+        logger.info('Loading pretrained models...')
+        with timer('Models loading', logger.info):
+            registry.warmup()
+
+    video_options = {'batch_size': args.batch_size, 'detection_scale': args.detection_scale,
+                     'track_interval': args.track_interval, 'sample_rate': args.fps, 'threads': args.threads,
+                     'fer_threshold': args.fer_threshold}
+    audio_options = {'extractor': args.audio_extractor}
+
+    if args.live:
+        live(args, video_options, audio_options)
+        if args.metrics is not None:
+            metrics.save(args.metrics)
+        return
+
+    sources = pipeline.load_sources(bounds=args.bounds[0] if args.bounds is not None else None,
+                                    text=args.text[0] if args.text is not None else None,
+                                    audio=args.audio,
+                                    audio_dir=args.audio_dir[0] if args.audio_dir is not None else None,
+                                    video=args.video[0] if args.video is not None else None)
+    checkpoint = Checkpoint(args.checkpoint, args.checkpoint_interval) if args.checkpoint is not None else None
+    results = pipeline.analyze(video_options=video_options, audio_options=audio_options, workers=args.audio_workers,
+                               cache=cache, concurrent=args.concurrent, checkpoint=checkpoint, **sources)
+    if checkpoint is not None:
+        # The analysis is finished, so it will not be resumed
+        checkpoint.remove()
+
+    logger.info('Model registry stats: {}'.format(registry.stats()))
+    if args.metrics is not None:
+        metrics.save(args.metrics)
 
     # Show results
     if args.video is not None and args.bounds is None:
+        import matplotlib.pyplot as plt
         plt.plot(results['Video'])
         plt.ylabel('Sentiment')
         plt.xlabel('Time')
         plt.show()
     else:
-        show_results(results, args.bounds)
+        show_results(results, sources['bounds'])
+
+
+def live(args, video_options, audio_options):
+    """Analyze the sources while they are being written, logging each utterance as soon as it ends"""
+    from multimodal import pipeline
+    from multimodal.stream import LiveAnalysis
+
+    sources = pipeline.load_sources(bounds=args.bounds[0], text=args.text[0] if args.text is not None else None)
+    video = args.video[0] if args.video is not None else None
+    # Devices are opened by their index
+    if video is not None and video.isdigit():
+        video = int(video)
+    analysis = LiveAnalysis(sources['bounds'], text=sources['text'],
+                            audio=args.audio[0] if args.audio is not None else None, video=video,
+                            video_options=video_options, audio_options=audio_options, timeout=args.live_timeout)
+    results = {}
+    for utterance in analysis.run():
+        logger.info('Utterance {} ({:.3f} - {:.3f}): {}'.format(utterance['index'], utterance['start'],
+                                                               utterance['end'] or float('nan'), utterance['results']))
+        for name, value in utterance['results'].items():
+            results.setdefault(name, []).append(value)
+    # Analyses which failed for some utterance cannot be summarized
+    results = {name: values for name, values in results.items() if None not in values}
+    show_results(results, sources['bounds'])
 
 
 def read_config_file(file):
@@ -159,18 +196,19 @@ def read_config_file(file):
 
 
 def show_results(results, bounds):
+    from multimodal.pipeline import summary
+    rows = summary(results, bounds)
+
     table = PrettyTable()
-    table.field_names = ['Modality'] + ['%0.3f' % (end) for end in bounds['#endtime']] + ['Majority']
+    table.field_names = ['Modality'] + rows['utterances'] + ['Majority']
     table.align['Modality'] = 'l'
     table.align['Majority'] = 'r'
 
-    for end in bounds['#endtime']:
-        name = '%0.3f' % (end)
+    for name in rows['utterances']:
         table.align[name] = 'r'
 
-    for k, v in dict.items(results):
-        v = [ int(x) for x in v ]
-        table.add_row([k] + v + [max(v, key=v.count)])
+    for row in rows['results']:
+        table.add_row([row['modality']] + row['values'] + [row['majority']])
 
     print()
     print(table.get_string(title="Results from multimodal analysis"))
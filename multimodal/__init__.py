@@ -1,21 +0,0 @@
-import nltk
-
-try:
-    nltk.data.find('corpora/opinion_lexicon')
-except LookupError:
-    nltk.download('opinion_lexicon')
-
-try:
-    nltk.data.find('corpora/wordnet')
-except LookupError:
-    nltk.download('wordnet')
-
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
-
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
@@ -1,14 +1,34 @@
 import logging
-import os
+import numpy as np
 import pandas as pd
+from .frame import FeatureFrame
+from .metrics import metrics
 from .utils import custom_tokenizer
 from .selector import Selector
-from sklearn.externals import joblib
+from .registry import registry
 
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-path = os.path.dirname(os.path.abspath(__file__))
+
+def _to_frame(features, columns):
+    """
+        Build a DataFrame with one row per sample from a DataFrame, FeatureFrame, ndarray,
+        pd.Series or list of ndarrays or pd.Series. The index column of a FeatureFrame (e.g. timestamp) is dropped.
+    """
+    if isinstance(features, pd.DataFrame):
+        return features
+    if isinstance(features, FeatureFrame):
+        return features.to_frame(index=False)
+    if isinstance(features, pd.Series):
+        return pd.DataFrame(features).T
+    if isinstance(features, np.ndarray):
+        return pd.DataFrame(np.atleast_2d(features), columns=columns)
+    features = list(features)
+    if features and all(isinstance(row, np.ndarray) for row in features):
+        # e.g. the rows returned by AudioFeatures.run
+        return pd.DataFrame(np.vstack(features), columns=columns)
+    return pd.DataFrame(features)
 
 
 def text_analyzer(text):
@@ -16,28 +36,58 @@ def text_analyzer(text):
         Pretrained model for emotion recognition in text.
         :param text: text to predict
     """
-    pipeline = joblib.load(os.path.join(path, 'models/text.pkl'))
-    return pipeline.predict([text])[0]
+    return text_batch_analyzer([text])[0]
 
 
 def audio_analyzer(audio):
     """
         Pretrained model for emotion recognition in audio.
-        :param audio: audio features as a pd.Series
+        :param audio: audio features as returned by AudioFeatures.run, or a pd.Series
     """
-    pipeline = joblib.load(os.path.join(path, 'models/audio.pkl'))
-    features = pd.DataFrame(audio).T
-    return pipeline.predict(features)[0]
+    return audio_batch_analyzer(audio)[0]
 
 
 def video_analyzer(video):
     """
         Pretrained model for emotion recognition in audio.
-        :param video: video features as a pd.Series
+        :param video: emotions of a frame or utterance as an ndarray or pd.Series
+    """
+    return video_batch_analyzer(video)[0]
+
+
+def text_batch_analyzer(texts):
+    """
+        Pretrained model for emotion recognition in text, in a single prediction.
+        :param texts: list, ndarray or pd.Series of texts to predict
+    """
+    pipeline = registry.get('text')
+    texts = list(texts)
+    with metrics.span('predict', items=len(texts)):
+        return pipeline.predict(texts)
+
+
+def audio_batch_analyzer(audio):
+    """
+        Pretrained model for emotion recognition in audio, in a single prediction.
+        :param audio: audio features as a pd.DataFrame or FeatureFrame with one row per utterance,
+                      an ndarray or list of ndarrays with the columns of Selector.AUDIO_COLUMNS or a list of pd.Series
+    """
+    pipeline = registry.get('audio')
+    audio = _to_frame(audio, Selector.AUDIO_COLUMNS)
+    with metrics.span('predict', items=len(audio)):
+        return pipeline.predict(audio)
+
+
+def video_batch_analyzer(video):
+    """
+        Pretrained model for emotion recognition in video, in a single prediction.
+        :param video: video features as a pd.DataFrame or FeatureFrame with one row per frame or utterance,
+                      an ndarray or list of ndarrays with the columns of Selector.VIDEO_MODEL_COLUMNS or a list of pd.Series
     """
-    pipeline = joblib.load(os.path.join(path, 'models/video.pkl'))
-    features = pd.DataFrame(video).T
-    return pipeline.predict(features)[0]
+    pipeline = registry.get('video')
+    video = _to_frame(video, Selector.VIDEO_MODEL_COLUMNS)[Selector.VIDEO_MODEL_COLUMNS]
+    with metrics.span('predict', items=len(video)):
+        return pipeline.predict(video)
 
 
 def bimodal_analyzer(features, modalities):
@@ -54,14 +104,15 @@ def bimodal_analyzer(features, modalities):
     if len(modalities) != 2:
         raise Exception('length of modalities is {} and must be 2'.format(len(modalities)))
     if 'text' in modalities and 'audio' in modalities:
-        pipeline = joblib.load(os.path.join(path, 'models/text_audio.pkl'))
+        pipeline = registry.get('text_audio')
     elif 'audio' in modalities and 'video' in modalities:
-        pipeline = joblib.load(os.path.join(path, 'models/audio_video.pkl'))
+        pipeline = registry.get('audio_video')
     elif 'video' in modalities and 'text' in modalities:
-        pipeline = joblib.load(os.path.join(path, 'models/video_text.pkl'))
+        pipeline = registry.get('video_text')
     else:
         raise Exception('This combination of modalities are not supported!')
-    return pipeline.predict(features)
+    with metrics.span('predict', items=len(features)):
+        return pipeline.predict(features)
 
 
 def multimodal(features):
@@ -69,5 +120,6 @@ def multimodal(features):
         Pretrained model for emotion recognition in text + audio + video.
         :param features: text + audio + video features as a pd.DataFrame
     """
-    pipeline =  joblib.load(os.path.join(path, 'models/multimodal.pkl'))
-    return pipeline.predict(features)
+    pipeline = registry.get('multimodal')
+    with metrics.span('predict', items=len(features)):
+        return pipeline.predict(features)
@@ -0,0 +1,222 @@
+import logging
+import numpy as np
+from functools import lru_cache
+from numpy.lib.stride_tricks import as_strided
+from scipy.fftpack import dct
+from scipy.io import wavfile
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Same constant as pyAudioAnalysis so that features match the ones the models were trained with
+eps = 0.00000001
+
+NAMES = ['zcr', 'energy', 'energy_entropy', 'spectral_centroid', 'spectral_spread', 'spectral_entropy',
+         'spectral_flux', 'spectral_rolloff'] + \
+        ['mfcc_{}'.format(i) for i in range(1, 14)] + \
+        ['chroma_{}'.format(i) for i in range(1, 13)] + ['chroma_std']
+
+
+def mono(x):
+    """Mono signal of a stereo one, as audioBasicIO.stereo2mono does"""
+    if x.ndim == 2:
+        if x.shape[1] == 1:
+            x = x.flatten()
+        elif x.shape[1] == 2:
+            x = (x[:, 1] / 2) + (x[:, 0] / 2)
+    return x
+
+
+def read_wav(file):
+    """
+        Read a WAV file as a mono signal, as audioBasicIO.readAudioFile and stereo2mono do.
+
+        :return: sampling rate and signal
+    """
+    fs, x = wavfile.read(file)
+    return fs, mono(x)
+
+
+def open_wav(file):
+    """
+        Memory-map a WAV file. Samples are read from disk only when they are used.
+
+        :return: sampling rate and samples, with one column per channel if it is not mono
+    """
+    return wavfile.read(file, mmap=True)
+
+
+def segment(x, fs, start, end):
+    """
+        Mono signal between two instants of a memory-mapped WAV file. Only the samples
+        of the segment are read and copied.
+
+        :param start: start in seconds
+        :param end: end in seconds. An empty end means until the end of the file.
+    """
+    first = max(int(round(float(start) * fs)), 0)
+    last = int(round(float(end) * fs)) if end and not np.isnan(end) else len(x)
+    return mono(np.array(x[first:max(last, first)]))
+
+
+@lru_cache(maxsize=16)
+def filter_banks(fs, nfft):
+    """Triangular filter banks used for the MFCCs, as in pyAudioAnalysis mfccInitFilterBanks"""
+    lowfreq = 133.33
+    linsc = 200 / 3.
+    logsc = 1.0711703
+    lin_filters = 13
+    log_filters = 27
+    filters = lin_filters + log_filters
+    freqs = np.zeros(filters + 2)
+    freqs[:lin_filters] = lowfreq + np.arange(lin_filters) * linsc
+    freqs[lin_filters:] = freqs[lin_filters - 1] * logsc ** np.arange(1, log_filters + 3)
+    heights = 2. / (freqs[2:] - freqs[0:-2])
+    fbank = np.zeros((filters, nfft))
+    nfreqs = np.arange(nfft) / (1. * nfft) * fs
+    for i in range(filters):
+        low, center, high = freqs[i], freqs[i + 1], freqs[i + 2]
+        lid = np.arange(np.floor(low * nfft / fs) + 1, np.floor(center * nfft / fs) + 1, dtype=int)
+        rid = np.arange(np.floor(center * nfft / fs) + 1, np.floor(high * nfft / fs) + 1, dtype=int)
+        fbank[i][lid] = heights[i] / (center - low) * (nfreqs[lid] - low)
+        fbank[i][rid] = heights[i] / (high - center) * (high - nfreqs[rid])
+    return fbank
+
+
+@lru_cache(maxsize=16)
+def chroma_matrix(fs, nfft):
+    """
+        Matrix which maps the power spectrum to the 12 chroma bins, as pyAudioAnalysis
+        stChromaFeatures does for each frame.
+    """
+    freqs = (np.arange(nfft) + 1) * fs / (2. * nfft)
+    chroma = np.round(12.0 * np.log2(freqs / 27.50)).astype(int)
+    if chroma.max() >= nfft:
+        raise Exception('Window too short for chroma features')
+    counts = np.zeros(nfft)
+    for u in np.unique(chroma):
+        index = np.nonzero(chroma == u)
+        counts[index] = index[0].shape
+    # Frequencies with the same chroma index overwrite each other: the last one is kept.
+    # Negative indices wrap around as in NumPy indexing.
+    targets = chroma % nfft
+    divisors = counts[targets]
+    sources = {}
+    for source, target in enumerate(targets):
+        sources[target] = source
+    matrix = np.zeros((nfft, 12))
+    for target, source in sources.items():
+        matrix[source, target % 12] += 1. / divisors[target]
+    return matrix
+
+
+def frames(signal, window, step):
+    """View of the signal as overlapping frames of the given length, without copying it"""
+    count = (len(signal) - window) // step + 1
+    if count <= 0:
+        return signal[:0].reshape(0, window)
+    return as_strided(signal, shape=(count, window), strides=(step * signal.strides[0], signal.strides[0]),
+                      writeable=False)
+
+
+def blocks_entropy(x, total, blocks=10):
+    """Entropy of the energy of 10 contiguous blocks of each row"""
+    length = x.shape[1] // blocks
+    energies = np.sum(x[:, :length * blocks].reshape(len(x), blocks, length) ** 2, axis=2)
+    s = energies / (total[:, None] + eps)
+    return -np.sum(s * np.log2(s + eps), axis=1)
+
+
+def short_term_features(signal, fs, window, step, block=2048):
+    """
+        34 short-term features of each frame of a signal, the same as pyAudioAnalysis
+        stFeatureExtraction, computed for many frames at once.
+
+        :param signal: mono signal
+        :param fs: sampling rate
+        :param window: frame length in samples
+        :param step: frame step in samples
+        :param block: number of frames processed at once, which bounds the memory used
+        :return: np.array with one row per frame and the feature names
+
+        **Example**::
+
+            fs, x = read_wav('path/to/file.wav')
+            F, names = short_term_features(x, fs, 0.050 * fs, 0.025 * fs)
+    """
+    window, step = int(window), int(step)
+    nfft = window // 2
+    signal = np.double(signal) / (2.0 ** 15)
+    # As stFeatureExtraction, the maximum is taken before removing the DC offset
+    maximum = np.abs(signal).max()
+    signal = (signal - signal.mean()) / (maximum + 0.0000000001)
+
+    fbank = filter_banks(fs, nfft)
+    chroma = chroma_matrix(fs, nfft)
+    ind = np.arange(1, nfft + 1) * (fs / (2.0 * nfft))
+    windows = frames(signal, window, step)
+    features = np.zeros((len(windows), len(NAMES)))
+    previous = None
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, len(windows), block):
+            x = windows[start:start + block]
+            F = features[start:start + block]
+            X = np.abs(np.fft.rfft(x, axis=1))[:, :nfft] / nfft
+            energy = np.sum(x ** 2, axis=1)
+            power = X ** 2
+            spectrum = np.sum(power, axis=1)
+
+            # Time domain
+            F[:, 0] = np.sum(np.abs(np.diff(np.sign(x), axis=1)), axis=1) / 2 / (window - 1.0)
+            F[:, 1] = energy / window
+            F[:, 2] = blocks_entropy(x, energy)
+
+            # Spectral centroid and spread
+            Xt = X / X.max(axis=1, keepdims=True)
+            den = np.sum(Xt, axis=1) + eps
+            centroid = np.sum(ind * Xt, axis=1) / den
+            F[:, 3] = centroid / (fs / 2.0)
+            F[:, 4] = np.sqrt(np.sum((ind - centroid[:, None]) ** 2 * Xt, axis=1) / den) / (fs / 2.0)
+            F[:, 5] = blocks_entropy(X, spectrum)
+
+            # Spectral flux with the previous frame, 0 for the first one
+            normalized = X / np.sum(X + eps, axis=1, keepdims=True)
+            if previous is None:
+                previous = normalized[:1]
+            F[:, 6] = np.sum((normalized - np.vstack([previous, normalized[:-1]])) ** 2, axis=1)
+            previous = normalized[-1:]
+
+            # Spectral rolloff at 90% of the energy
+            above = np.cumsum(power, axis=1) + eps > 0.90 * spectrum[:, None]
+            F[:, 7] = np.where(above.any(axis=1), above.argmax(axis=1) / float(nfft), 0.0)
+
+            # MFCCs
+            F[:, 8:21] = dct(np.log10(X.dot(fbank.T) + eps), type=2, norm='ortho', axis=-1)[:, :13]
+
+            # Chroma
+            C = power.dot(chroma) / spectrum[:, None]
+            F[:, 21:33] = C
+            F[:, 33] = C.std(axis=1)
+
+    return features, list(NAMES)
+
+
+def mid_term_features(signal, fs, mid_window, mid_step, window, step):
+    """
+        Long-term average of the mid-term mean and standard deviation of the short-term
+        features, as pyAudioAnalysis mtFeatureExtraction followed by the mean of fileRegression.
+
+        :param mid_window: mid-term window in samples
+        :param mid_step: mid-term step in samples
+        :param window: short-term window in samples
+        :param step: short-term step in samples
+        :return: np.array with the mean and then the deviation of each feature, and the
+                 short-term features with one row per frame
+    """
+    short, _ = short_term_features(signal, fs, window, step)
+    ratio = int(round(mid_window / step))
+    step_ratio = int(round(mid_step / step))
+    mid = [np.concatenate([short[p:p + ratio].mean(axis=0), short[p:p + ratio].std(axis=0)])
+           for p in range(0, len(short), step_ratio)]
+    return np.mean(mid, axis=0), short
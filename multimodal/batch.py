@@ -0,0 +1,190 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import pandas as pd
+import traceback
+import yaml
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from . import pipeline
+from .utils import timer
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SOURCES = ['bounds', 'text', 'audio', 'audio_dir', 'video']
+
+
+def read_manifest(file):
+    """
+        Read the items of a batch from a manifest or a dataset directory.
+
+        A manifest is a CSV or YAML file with one item per row, with an id and any of the
+        sources: bounds, text, audio_dir and video. A dataset directory must follow this layout,
+        where the transcriptions file is used both as bounds and text:
+
+        - dataset/transcriptions/<id>.csv
+        - dataset/audioFiles/<id>/*.wav
+        - dataset/<id>.mp4
+
+        :return: list of dictionaries with the id and the sources of each item
+    """
+    if os.path.isdir(file):
+        return read_dataset(file)
+    extension = os.path.splitext(file)[1].lower()
+    if extension in ('.yml', '.yaml'):
+        with open(file, 'r') as stream:
+            rows = yaml.safe_load(stream) or []
+    elif extension == '.csv':
+        rows = pd.read_csv(file, sep=None, engine='python').to_dict('records')
+    else:
+        raise Exception('Manifest format {} not supported'.format(extension))
+
+    items = []
+    for index, row in enumerate(rows):
+        item = {source: row.get(source) for source in SOURCES}
+        # Empty cells in CSV manifests are read as NaN
+        item = {k: v if not (isinstance(v, float) and v != v) else None for k, v in item.items()}
+        if isinstance(item['audio'], str):
+            item['audio'] = item['audio'].split()
+        item['id'] = str(row.get('id', index))
+        items.append(item)
+    return items
+
+
+def read_dataset(directory):
+    """Items of a dataset directory, see read_manifest"""
+    ids = set(os.path.splitext(os.path.basename(file))[0]
+              for file in glob.glob(os.path.join(directory, 'transcriptions', '*.csv')) +
+              glob.glob(os.path.join(directory, '*.mp4')))
+    items = []
+    for id in sorted(ids):
+        transcription = os.path.join(directory, 'transcriptions', id + '.csv')
+        audio_dir = os.path.join(directory, 'audioFiles', id)
+        video = os.path.join(directory, id + '.mp4')
+        items.append({
+            'id': id,
+            'bounds': transcription if os.path.isfile(transcription) else None,
+            'text': transcription if os.path.isfile(transcription) else None,
+            'audio': None,
+            'audio_dir': audio_dir if os.path.isdir(audio_dir) else None,
+            'video': video if os.path.isfile(video) else None
+        })
+    return items
+
+
+def finished(output):
+    """Ids of the items already analyzed successfully in an output file"""
+    done = set()
+    if os.path.isfile(output):
+        with open(output, 'r') as stream:
+            for line in stream:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Last line may be incomplete if the batch was killed
+                    continue
+                if record.get('status') == 'done':
+                    done.add(record['id'])
+    return done
+
+
+# Modalities whose models are loaded in this worker process, and error of those which cannot be loaded
+_loaded = set()
+_errors = {}
+
+
+def modalities(item):
+    """Modalities analyzed for an item, given its sources"""
+    sources = {'text': ['text'], 'audio': ['audio', 'audio_dir'], 'video': ['video']}
+    return [modality for modality in pipeline.MODALITIES
+            if any(item.get(source) is not None for source in sources[modality])]
+
+
+def initialize(modalities):
+    """
+        Load the models of the given modalities once per worker process. Models which cannot be
+        loaded are not tried again, and only the items which need them fail. The models of the
+        combinations of modalities are loaded on first use.
+    """
+    for modality in modalities:
+        if modality not in _loaded and modality not in _errors:
+            try:
+                pipeline.warmup(modalities=[modality])
+                _loaded.add(modality)
+            except Exception as e:
+                logger.warning('Models for {} cannot be loaded: {}'.format(modality, e))
+                _errors[modality] = e
+    for modality in modalities:
+        if modality in _errors:
+            raise Exception('Models for {} cannot be loaded: {}'.format(modality, _errors[modality]))
+
+
+def analyze_item(item, options):
+    """Analyze one item of the batch. Failures are returned in the record instead of raised"""
+    try:
+        initialize(modalities(item))
+        sources = pipeline.load_sources(**{source: item[source] for source in SOURCES})
+        results = pipeline.analyze(**dict(options, **sources))
+        if sources['bounds'] is not None:
+            results = pipeline.summary(results, sources['bounds'])
+        else:
+            results = {k: [float(x) for x in v] for k, v in results.items()}
+        return {'id': item['id'], 'status': 'done', 'results': results}
+    except Exception as e:
+        logger.warning('Item {} failed: {}'.format(item['id'], e))
+        return {'id': item['id'], 'status': 'failed', 'error': str(e), 'traceback': traceback.format_exc()}
+
+
+def run(items, output, workers=1, **options):
+    """
+        Analyze every item not yet done in the output file across a pool of processes.
+        Each record is appended to the output file (JSON lines) as soon as it is finished,
+        so an interrupted batch can be resumed with the same output file.
+
+        :param items: list of items as returned by read_manifest
+        :param output: path of the results file
+        :param workers: number of processes
+        :param options: keyword arguments for pipeline.analyze (video_options, cache)
+        :return: number of items done and failed
+    """
+    done = finished(output)
+    pending = [item for item in items if item['id'] not in done]
+    logger.info('{} items to analyze, {} already done'.format(len(pending), len(items) - len(pending)))
+    counts = {'done': 0, 'failed': 0}
+    with open(output, 'a') as stream, ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(analyze_item, item, options): item for item in pending}
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except Exception as e:
+                # The worker process died
+                record = {'id': futures[future]['id'], 'status': 'failed', 'error': str(e)}
+            counts[record['status']] += 1
+            stream.write(json.dumps(record) + '\n')
+            stream.flush()
+            logger.info('Item {} {} ({}/{})'.format(record['id'], record['status'], sum(counts.values()), len(pending)))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze many videos, transcriptions and audio files in a batch')
+    parser.add_argument('manifest', help='Manifest file (CSV or YAML) or dataset directory')
+    parser.add_argument('--output', help='Results file in JSON lines format (default: results.jsonl)',
+                        default='results.jsonl')
+    parser.add_argument('--workers', help='Number of processes (default: 1)', type=int, default=1)
+    parser.add_argument('--fps', help='Analyze the videos at this frame rate instead of every frame', type=float)
+    parser.add_argument('--no-cache', help='Do not read or write the features cache', action='store_true')
+    args = parser.parse_args()
+
+    from .cache import FeatureCache
+    items = read_manifest(args.manifest)
+    with timer('Batch analysis', logger.info):
+        counts = run(items, args.output, workers=args.workers, video_options={'sample_rate': args.fps},
+                     cache=None if args.no_cache else FeatureCache())
+    logger.info('{} items done and {} failed'.format(counts['done'], counts['failed']))
+
+
+if __name__ == '__main__':
+    main()
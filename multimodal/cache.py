@@ -0,0 +1,181 @@
+import hashlib
+import json
+import logging
+import numpy as np
+import os
+import tempfile
+import threading
+from .frame import FeatureFrame
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class FeatureCache:
+    """
+        Persistent on-disk cache of extracted features.
+
+        Each entry is a FeatureFrame stored column by column in a NumPy .npz file, keyed by the
+        hash of the input file content, the model files and the parameters used for the
+        extraction. Features are stored as float32 like in the FeatureFrame, and its index as
+        float64. When the cache grows above max_size, the least recently used entries are removed.
+
+        :param directory: directory where entries are stored
+        :param max_size: maximum size of the cache in bytes
+
+        **Example**::
+
+            cache = FeatureCache()
+            key = cache.key('path/to/file.wav', models=['path/to/model'], window=0.050, step=0.025)
+            frame = cache.load_frame(key)
+            if frame is None:
+                cache.save_frame(key, extract('path/to/file.wav'))
+    """
+
+    # Increase when extraction changes so that stale entries are not reused
+    VERSION = 2
+    DIRECTORY = os.environ.get('MULTIMODAL_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'multimodal'))
+    MAX_SIZE = 1024 ** 3
+
+    def __init__(self, directory=None, max_size=None):
+        self.directory = directory or self.DIRECTORY
+        self.max_size = max_size if max_size is not None else self.MAX_SIZE
+        self._hashes = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __getstate__(self):
+        # Locks cannot be pickled, e.g. when the cache is sent to a process pool
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def hash(self, file):
+        """SHA-1 of the file content, memoized while the file is not modified"""
+        stat = os.stat(file)
+        signature = (os.path.realpath(file), stat.st_size, stat.st_mtime)
+        with self._lock:
+            if signature in self._hashes:
+                return self._hashes[signature]
+        sha1 = hashlib.sha1()
+        with open(file, 'rb') as stream:
+            for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                sha1.update(chunk)
+        with self._lock:
+            self._hashes[signature] = sha1.hexdigest()
+        return self._hashes[signature]
+
+    def key(self, file, models=(), **params):
+        """
+            Key of the entry for a file extracted with the given parameters
+
+            :param models: files of the models used for the extraction, whose size and modification
+                           time are part of the key so that a retrained model does not reuse old entries
+        """
+        signatures = []
+        for model in models:
+            stat = os.stat(model)
+            signatures.append([os.path.realpath(model), stat.st_size, stat.st_mtime])
+        params = json.dumps(dict(params, models=signatures, version=self.VERSION), sort_keys=True, default=str)
+        return '{}-{}'.format(self.hash(file), hashlib.sha1(params.encode('utf-8')).hexdigest())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def _read(self, key):
+        """Column names and arrays stored under the key, or None if there is no such entry"""
+        file = self._path(key)
+        try:
+            with np.load(file, allow_pickle=False) as data:
+                columns = [str(column) for column in data['__columns__']]
+                arrays = [data['c{}'.format(i)] for i in range(len(columns))]
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+        # Mark the entry as recently used
+        os.utime(file, None)
+        return columns, arrays
+
+    def _write(self, key, columns, arrays):
+        """Store one array per column under the key"""
+        data = {'c{}'.format(i): np.asarray(array) for i, array in enumerate(arrays)}
+        data['__columns__'] = np.array([str(column) for column in columns])
+        descriptor, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as stream:
+                np.savez(stream, **data)
+            os.replace(tmp, self._path(key))
+        except Exception:
+            os.remove(tmp)
+            raise
+        self.evict()
+
+    def load_frame(self, key, index=None):
+        """
+            FeatureFrame stored under the key or None if there is no such entry
+
+            :param index: name of the index column of the frame, e.g. timestamp
+        """
+        entry = self._read(key)
+        if entry is None:
+            return None
+        columns, arrays = entry
+        if index is not None and index not in columns:
+            return None
+        features = [column for column in columns if column != index]
+        frame = FeatureFrame(features, rows=len(arrays[0]) if arrays else 0, index=index)
+        for i, column in enumerate(columns):
+            if column == index:
+                frame.index[:] = arrays[i]
+            else:
+                frame.values[:, features.index(column)] = arrays[i]
+        return frame
+
+    def save_frame(self, key, frame):
+        """Store a FeatureFrame under the key, one float32 array per feature and the float64 index"""
+        columns, arrays = list(frame.columns), list(np.asarray(frame.values, dtype=np.float32).T)
+        if frame.index is not None:
+            columns.append(frame.index_name)
+            arrays.append(frame.index)
+        self._write(key, columns, arrays)
+
+    def entries(self):
+        """(path, size, last use) of every entry"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                file = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(file)
+                except OSError:
+                    continue
+                entries.append((file, stat.st_size, stat.st_mtime))
+        return entries
+
+    def size(self):
+        """Total size of the entries in bytes"""
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in max_size"""
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        while entries and total > self.max_size:
+            file, size, _ = entries.pop(0)
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Remove every entry"""
+        for file, _, _ in self.entries():
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+        logger.info('Features cache {} cleared'.format(self.directory))
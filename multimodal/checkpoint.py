@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import numpy as np
+import os
+import tempfile
+import threading
+from time import time
+from .metrics import metrics
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    """
+        Periodic snapshot of the partial results of a long analysis in a single .npz file, so
+        that an analysis which is killed or preempted can resume where it stopped.
+
+        Each stage (e.g. video or audio) stores its arrays in its own section together with
+        the key of its inputs and options, and a section saved for other inputs is ignored.
+        The file is replaced atomically, so a crash while saving keeps the previous snapshot.
+
+        :param file: path of the checkpoint file
+        :param interval: minimum number of seconds between two snapshots
+
+        **Example**::
+
+            checkpoint = Checkpoint('analysis.npz')
+            key = Checkpoint.key('path/to/video.mp4', sample_rate=5)
+            state = checkpoint.load('video', key)
+            for position, values in work(state):
+                if checkpoint.due():
+                    checkpoint.update('video', key, values=values, position=position)
+    """
+
+    SEPARATOR = '__'
+
+    def __init__(self, file, interval=60):
+        self.file = file
+        self.interval = interval
+        # Key and arrays of each section
+        self._sections = {}
+        self._saved = time()
+        self._lock = threading.Lock()
+        self._read()
+
+    @staticmethod
+    def key(files, **params):
+        """
+            Key of the inputs of a stage: path, size and modification time of each file and
+            the parameters which change its results.
+        """
+        files = [files] if isinstance(files, str) else list(files)
+        signatures = []
+        for file in files:
+            stat = os.stat(file)
+            signatures.append([os.path.realpath(file), stat.st_size, stat.st_mtime])
+        params = json.dumps(dict(params, files=signatures), sort_keys=True, default=str)
+        return hashlib.sha1(params.encode('utf-8')).hexdigest()
+
+    def _read(self):
+        try:
+            with np.load(self.file, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (IOError, OSError, ValueError):
+            return
+        for name, array in arrays.items():
+            section, _, field = name.partition(self.SEPARATOR)
+            section = self._sections.setdefault(section, [None, {}])
+            if field == 'key':
+                section[0] = str(array)
+            else:
+                section[1][field] = array
+        logger.info('Checkpoint {} found with {}'.format(self.file, ', '.join(sorted(self._sections))))
+
+    def load(self, name, key):
+        """Arrays saved for a stage, or None if there are none for the given key"""
+        with self._lock:
+            if name not in self._sections or self._sections[name][0] != key:
+                return None
+            return dict(self._sections[name][1])
+
+    def due(self):
+        """Whether interval seconds have passed since the last snapshot"""
+        return time() - self._saved >= self.interval
+
+    def update(self, name, key, **arrays):
+        """Replace the arrays of a stage and write a snapshot of every stage"""
+        with self._lock:
+            self._sections[name] = [key, {field: np.array(array) for field, array in arrays.items()}]
+            self._write()
+
+    def _write(self):
+        data = {}
+        for name, (key, arrays) in self._sections.items():
+            data[name + self.SEPARATOR + 'key'] = np.array(key)
+            for field, array in arrays.items():
+                data[name + self.SEPARATOR + field] = array
+        directory = os.path.dirname(os.path.abspath(self.file))
+        with metrics.span('checkpoint'):
+            descriptor, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(descriptor, 'wb') as stream:
+                    np.savez(stream, **data)
+                os.replace(tmp, self.file)
+            except Exception:
+                os.remove(tmp)
+                raise
+        self._saved = time()
+
+    def remove(self):
+        """Remove the checkpoint, e.g. once the analysis is finished"""
+        with self._lock:
+            self._sections = {}
+            if os.path.exists(self.file):
+                os.remove(self.file)
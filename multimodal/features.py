@@ -1,9 +1,24 @@
+import glob
 import logging
+import numpy as np
 import os
 import pandas as pd
-from pyAudioAnalysis import audioBasicIO, audioFeatureExtraction
-from pyAudioAnalysis import audioTrainTest as aT
-from .video import VideoAnalyzer
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from .checkpoint import Checkpoint
+from .frame import FeatureFrame
+from .metrics import metrics
+from .registry import registry
+from .selector import Selector
+from .utils import lazy_import
+
+# Heavy backends are imported only when their modality is analyzed
+audioBasicIO = lazy_import('pyAudioAnalysis.audioBasicIO')
+audioFeatureExtraction = lazy_import('pyAudioAnalysis.audioFeatureExtraction')
+aT = lazy_import('pyAudioAnalysis.audioTrainTest')
+audio = lazy_import(__package__ + '.audio')
+video = lazy_import(__package__ + '.video')
+fermodel = lazy_import(__package__ + '.fermodel')
 
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -14,69 +29,385 @@ path = os.path.dirname(os.path.abspath(__file__))
 class Features:
     """
         Extract features from different sources base class
+
+        :param cache: FeatureCache where the features are stored
+        :param checkpoint: Checkpoint where the features computed so far are saved periodically
     """
 
-    def __init__(self, verbose=True, **kwargs):
+    def __init__(self, verbose=True, cache=None, checkpoint=None, **kwargs):
         self.verbose = verbose
+        self.cache = cache
+        self.checkpoint = checkpoint
 
     def run(self):
         pass
 
+    def restore(self, name, key, frame):
+        """
+            Rows of a frame computed by an interrupted analysis, read from the checkpoint.
+
+            :return: np.array of booleans, true for the rows already computed
+        """
+        done = np.zeros(len(frame), dtype=bool)
+        state = self.checkpoint.load(name, key) if self.checkpoint is not None else None
+        if state is not None:
+            done[:] = state['done']
+            frame[done] = state['values'][done]
+            logger.info('Resuming {} features: {} of {} found in checkpoint'.format(name, done.sum(), len(frame)))
+        return done
+
+    def snapshot(self, name, key, frame, done, force=False):
+        """Save the rows computed so far in the checkpoint, if a snapshot is due"""
+        if self.checkpoint is not None and (force or self.checkpoint.due()):
+            self.checkpoint.update(name, key, values=frame.values, done=done)
+
 
 class AudioFeatures(Features):
     """
         Extract features from audio file
         It computes 34 of short-term features implemented in pyAudioAnalysis library.
+
+        :param extractor: 'numpy' computes the short-term features of every frame at once,
+                          'pyaudioanalysis' uses stFeatureExtraction frame by frame
     """
 
-    def __init__(self, **kwargs):
+    EXTRACTORS = ['numpy', 'pyaudioanalysis']
+
+    def __init__(self, extractor='numpy', **kwargs):
+        if extractor not in self.EXTRACTORS:
+            raise Exception('Audio extractor {} not supported'.format(extractor))
+        self.extractor = extractor
         super().__init__(**kwargs)
 
     def run(self, file, window=0.050, step=0.025):
+        """
+            Features of an audio file: mean of the short-term features, arousal and valence.
+
+            :return: np.array with the columns of Selector.AUDIO_COLUMNS
+        """
+        if self.cache is not None:
+            key = self.cache.key(file, models=self.model_files(), kind='audio', window=window, step=step,
+                                 extractor=self.extractor)
+            frame = self.cache.load_frame(key)
+            if frame is not None and frame.columns == Selector.AUDIO_COLUMNS:
+                logger.info('Features from audio file {} found in cache'.format(os.path.basename(file)))
+                return frame[0]
         logger.info('Extracting features from audio file {}...'.format(os.path.basename(file)))
-        df = self.features(file, window, step).mean()
-        file, arousal, valence = self.get_arousal_valence(file)
-        df['arousal'] = arousal
-        df['valence'] = valence
-        return df
-
-    def features(self, file, window=0.050, step=0.025):
+        with metrics.span('audio_features'):
+            Fs, x = self.read(file)
+            F, names = self.short_term(x, Fs, window, step)
+        with metrics.span('svm'):
+            # Same mid-term features and SVMs as aT.fileRegression, without reading the file again
+            arousal, valence = self.regression(x, Fs)
+        values = self.summary(F, names, arousal, valence)
+        if self.cache is not None:
+            frame = FeatureFrame(Selector.AUDIO_COLUMNS, rows=1)
+            frame[0] = values
+            self.cache.save_frame(key, frame)
+        return values
+
+    def run_segments(self, file, starts, ends, window=0.050, step=0.025, workers=1):
+        """
+            Features of each utterance of a single long WAV file. The file is memory-mapped
+            and the features of each utterance are extracted from its own samples only.
+
+            :param file: WAV file with every utterance
+            :param starts: start of each utterance in seconds
+            :param ends: end of each utterance in seconds
+            :param workers: number of processes used to extract the utterances in parallel
+            :return: FeatureFrame with the columns of Selector.AUDIO_COLUMNS and one row per utterance
+        """
+        starts = [float(start) for start in starts]
+        ends = [float(end) if end and not np.isnan(end) else None for end in ends]
+        if self.cache is not None:
+            cache_key = self.cache.key(file, models=self.model_files(), kind='audio', window=window, step=step,
+                                       extractor=self.extractor, starts=starts, ends=ends)
+            frame = self.cache.load_frame(cache_key)
+            if frame is not None and frame.columns == Selector.AUDIO_COLUMNS:
+                logger.info('Features from audio file {} found in cache'.format(os.path.basename(file)))
+                return frame
+        logger.info('Extracting features of {} utterances from audio file {}...'.format(len(starts), os.path.basename(file)))
+        options = {'extractor': self.extractor, 'window': window, 'step': step}
+        frame = FeatureFrame(Selector.AUDIO_COLUMNS, rows=len(starts))
+        checkpoint_key = None
+        if self.checkpoint is not None:
+            checkpoint_key = Checkpoint.key(file, kind='audio', window=window, step=step, extractor=self.extractor,
+                                            starts=starts, ends=ends)
+        done = self.restore('audio', checkpoint_key, frame)
+        pending = [index for index in range(len(starts)) if not done[index]]
+        if workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+                rows = executor.map(audio_segment_features, [file] * len(pending), [starts[i] for i in pending],
+                                    [ends[i] for i in pending], [options] * len(pending))
+                for index, values in zip(pending, rows):
+                    frame[index] = values
+                    done[index] = True
+                    self.snapshot('audio', checkpoint_key, frame, done)
+        else:
+            Fs, x = audio.open_wav(file)
+            for index in pending:
+                frame[index] = audio_segment_features((Fs, x), starts[index], ends[index], options)
+                done[index] = True
+                self.snapshot('audio', checkpoint_key, frame, done)
+        self.snapshot('audio', checkpoint_key, frame, done, force=True)
+        if self.cache is not None:
+            self.cache.save_frame(cache_key, frame)
+        return frame
+
+    def segment(self, x, Fs, window=0.050, step=0.025):
+        """
+            Features of a mono signal: mean of the short-term features, arousal and valence.
+
+            :return: np.array with the columns of Selector.AUDIO_COLUMNS
+        """
+        with metrics.span('audio_features'):
+            F, names = self.short_term(x, Fs, window, step)
+        with metrics.span('svm'):
+            arousal, valence = self.regression(x, Fs)
+        return self.summary(F, names, arousal, valence)
+
+    @staticmethod
+    def summary(F, names, arousal, valence):
+        """Mean of the short-term features of every frame followed by arousal and valence, as a float32 row"""
+        with warnings.catch_warnings():
+            # NaN values are skipped and features without any value are NaN, as in pd.DataFrame.mean
+            warnings.simplefilter('ignore', RuntimeWarning)
+            means = np.nanmean(F, axis=0) if len(F) else np.full(len(names), np.nan)
+        values = dict(zip(names, means), arousal=arousal, valence=valence)
+        return np.array([values[column] for column in Selector.AUDIO_COLUMNS], dtype=np.float32)
+
+    def read(self, file):
+        """Sampling rate and mono signal of a WAV file"""
+        if self.extractor == 'numpy':
+            return audio.read_wav(file)
         [Fs, x] = audioBasicIO.readAudioFile(file)
-        F, f_names = audioFeatureExtraction.stFeatureExtraction(audioBasicIO.stereo2mono(x), Fs, window*Fs, step*Fs)
-        return pd.DataFrame(data=F.T, columns=f_names)
+        return Fs, audioBasicIO.stereo2mono(x)
 
-    def get_arousal_valence(self, file):
-        """Returns file, arousal and valence is this order."""
+    def features(self, file, window=0.050, step=0.025):
+        Fs, x = self.read(file)
+        return self.signal_features(x, Fs, window, step)
+
+    def short_term(self, x, Fs, window=0.050, step=0.025):
+        """Short-term features of a mono signal as an np.array with one row per frame, and their names"""
+        if self.extractor == 'numpy':
+            return audio.short_term_features(x, Fs, window*Fs, step*Fs)
+        F, f_names = audioFeatureExtraction.stFeatureExtraction(x, Fs, window*Fs, step*Fs)
+        return F.T, f_names
+
+    def signal_features(self, x, Fs, window=0.050, step=0.025):
+        """Short-term features of each frame of a mono signal"""
+        F, f_names = self.short_term(x, Fs, window, step)
+        return pd.DataFrame(data=F, columns=f_names)
+
+    @staticmethod
+    def model_files(name='svmSpeechEmotion'):
+        """Files of the SVM regression models and of their feature means"""
+        return sorted(glob.glob(os.path.join(path, 'models', name + '_*')))
+
+    @staticmethod
+    def regression_models(name='svmSpeechEmotion'):
+        """
+            Names of the SVM regression models (arousal and valence) and their registry keys.
+            Each one is loaded with load_regression_model once per process.
+        """
+        models = {}
+        prefix = os.path.join(path, 'models', name + '_')
+        for file in sorted(glob.glob(prefix + '*')):
+            if file.endswith('MEANS'):
+                continue
+            key = name + '_' + file[len(prefix):]
+            registry.register(key, lambda file=file: load_regression_model(file), replace=False)
+            models[file[len(prefix):]] = key
+        return models
+
+    def regression(self, x, Fs):
+        """
+            Arousal and valence of a mono signal, as aT.fileRegression computes them for a file.
+            NaN values are returned if they cannot be computed from the signal (e.g. it is too
+            short), while errors loading the models are raised.
+        """
+        models = {name: registry.get(key) for name, key in self.regression_models().items()}
+        _, _, _, mt_win, mt_step, st_win, st_step, compute_beat = models['arousal']
         try:
-            values, names = aT.fileRegression(file, os.path.join(path, 'models/svmSpeechEmotion'), 'svm')
-            return os.path.basename(file).split('.')[0], values[0], values[1]
+            if self.extractor == 'numpy':
+                mt_features, st_features = audio.mid_term_features(x, Fs, mt_win * Fs, mt_step * Fs,
+                                                                   round(Fs * st_win), round(Fs * st_step))
+                st_features = st_features.T
+            else:
+                result = audioFeatureExtraction.mtFeatureExtraction(x, Fs, mt_win * Fs, mt_step * Fs,
+                                                                    round(Fs * st_win), round(Fs * st_step))
+                mt_features, st_features = result[0].mean(axis=1), result[1]
+            if compute_beat:
+                beat, beat_conf = audioFeatureExtraction.beatExtraction(st_features, st_step)
+                mt_features = np.append(mt_features, [beat, beat_conf])
+            values = {}
+            for name in ('arousal', 'valence'):
+                model, MEAN, STD = models[name][:3]
+                values[name] = aT.regressionWrapper(model, 'svm', (mt_features - MEAN) / STD)
+            return values['arousal'], values['valence']
         except Exception as e:
             logger.warning(e)
-            return os.path.basename(file).split('.')[0], float('NaN'), float('NaN')
+            return float('NaN'), float('NaN')
+
+
+def load_regression_model(file):
+    """SVM regression model of pyAudioAnalysis, loaded with the function of the installed release"""
+    # loadSVModel was renamed to load_model in pyAudioAnalysis 0.2
+    load = getattr(aT, 'load_model', None) or aT.loadSVModel
+    return load(file, True)
+
+
+def audio_features(file, cache=None, options=None):
+    """
+        Audio features of a file. If they cannot be extracted, every feature is NaN.
+        It is a module function so that it can be sent to a process pool.
+
+        :param options: keyword arguments for AudioFeatures (extractor)
+        :return: np.array with the columns of Selector.AUDIO_COLUMNS
+    """
+    try:
+        return AudioFeatures(cache=cache, **(options or {})).run(file)
+    except Exception as e:
+        logger.warning('Features from audio file {} cannot be extracted: {}'.format(os.path.basename(file), e))
+        return np.full(len(Selector.AUDIO_COLUMNS), np.nan, dtype=np.float32)
+
+
+def audio_segment_features(file, start, end, options=None):
+    """
+        Audio features of an utterance of a long WAV file. If they cannot be extracted,
+        every feature is NaN. It is a module function so that it can be sent to a process pool.
+
+        :param file: WAV file, or its sampling rate and memory-mapped samples
+        :param options: keyword arguments for AudioFeatures (extractor) and the window and step
+        :return: np.array with the columns of Selector.AUDIO_COLUMNS
+    """
+    options = dict(options or {})
+    window, step = options.pop('window', 0.050), options.pop('step', 0.025)
+    try:
+        Fs, x = audio.open_wav(file) if isinstance(file, str) else file
+        return AudioFeatures(**options).segment(audio.segment(x, Fs, start, end), Fs, window, step)
+    except Exception as e:
+        logger.warning('Features from utterance {}-{} cannot be extracted: {}'.format(start, end, e))
+        return np.full(len(Selector.AUDIO_COLUMNS), np.nan, dtype=np.float32)
 
 
 class VideoFeatures(Features):
     """
         Extract features from audio file
         It a pretrained deep learning model for computing emotions.
+
+        Any other keyword argument (e.g. batch_size) is passed to the VideoAnalyzer.
     """
 
+    # VideoAnalyzer options which do not change the results
+    UNCACHED_OPTIONS = ['batch_size', 'threads']
+    # Default target emotions of the VideoAnalyzer
+    EMOTIONS = ['anger', 'happiness', 'calm']
+
     def __init__(self, **kwargs):
         self.model = os.path.join(path, 'models/haarcascade_frontalface_default.xml')
+        self.options = {k: v for k, v in kwargs.items() if k not in ('verbose', 'cache', 'checkpoint')}
         super().__init__(**kwargs)
 
-    def run(self, file):
+    def key(self, file, intervals=None):
+        """Cache key of the per-frame emotions of a video analyzed with the current options"""
+        options = {k: v for k, v in self.options.items() if k not in self.UNCACHED_OPTIONS}
+        if intervals is not None:
+            intervals = [[float(start), float(end) if end else None] for start, end in intervals]
+        return self.cache.key(file, models=self.model_files(), kind='video', intervals=intervals, **options)
+
+    def model_files(self):
+        """Files of the face detector and of the FER model used for the target emotions"""
+        return [self.model] + fermodel.FERModel.model_files(self.options.get('emotions', self.EMOTIONS))
+
+    def run(self, file, intervals=None):
+        """
+            :param file: video file in MP4 format
+            :param intervals: list of (start, end) tuples in seconds, only frames inside them are analyzed
+            :return: FeatureFrame with the emotions of each frame and their timestamp as index
+        """
+        if self.cache is not None:
+            # The analysis of the whole video is also valid for any intervals
+            keys = [self.key(file)] + ([self.key(file, intervals)] if intervals is not None else [])
+            for key in keys:
+                frame = self.cache.load_frame(key, index='timestamp')
+                if frame is not None:
+                    logger.info('Features from video file {} found in cache'.format(os.path.basename(file)))
+                    return frame
         logger.info('Extracting features from video file {}...'.format(os.path.basename(file)))
-        return VideoAnalyzer(self.model, file).analyze().toDataFrame()
+        analyzer = video.VideoAnalyzer(self.model, file, **self.options)
+        frame = analyzer.analyze(intervals=intervals, checkpoint=self.checkpoint).results
+        if self.cache is not None:
+            self.cache.save_frame(keys[-1], frame)
+        return frame
 
     def synchronize(self, df, start, end):
-        bounds = pd.Series({'start': start, 'end': end})
-        if end:
-            emotions = df[(df.timestamp >= start) & (df.timestamp < end)].mean()
-        else:
-            emotions = df[(df.timestamp >= start)].mean()
-        # Return a pd.Series
-        return pd.concat([bounds, emotions]).drop('timestamp')
+        """
+            Mean emotions of the frames between start and end.
+
+            :param df: FeatureFrame returned by run, or pd.DataFrame with a timestamp column
+            :return: pd.Series with start, end and the mean of each emotion
+        """
+        if isinstance(df, FeatureFrame):
+            means = self.means(df.index, df.values, [start], [end])[0]
+            return pd.Series([start, end] + list(means), index=['start', 'end'] + df.columns)
+        return self.synchronize_all(df, [start], [end]).iloc[0]
+
+    @staticmethod
+    def synchronize_all(df, starts, ends):
+        """
+            Mean emotions of the frames inside each interval.
+
+            :param df: per-frame features with a timestamp column
+            :param starts: start of each interval in seconds
+            :param ends: end of each interval in seconds. An empty end means until the end of the video.
+            :return: pd.DataFrame with start, end and the mean of each feature, one row per interval
+        """
+        columns = [column for column in df.columns if column != 'timestamp']
+        means = VideoFeatures.means(df['timestamp'].values, df[columns].values, starts, ends)
+        result = pd.DataFrame(means, columns=columns)
+        result.insert(0, 'end', list(ends))
+        result.insert(0, 'start', list(starts))
+        return result
+
+    @staticmethod
+    def synchronize_frame(frame, starts, ends):
+        """
+            Same means as synchronize_all for a FeatureFrame indexed by timestamp.
+
+            :return: FeatureFrame with the columns of the frame and one row per interval
+        """
+        starts, ends = list(starts), list(ends)
+        result = FeatureFrame(frame.columns, rows=len(starts))
+        result[:] = VideoFeatures.means(frame.index, frame.values, starts, ends)
+        return result
+
+    @staticmethod
+    def means(timestamps, values, starts, ends):
+        """
+            Mean of the rows of values whose timestamp is inside each interval, computed for every
+            interval at once with cumulative sums over the sorted timestamps.
+
+            :return: np.array with one row per interval
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        if np.any(np.diff(timestamps) < 0):
+            order = np.argsort(timestamps, kind='mergesort')
+            timestamps, values = timestamps[order], values[order]
+        # NaN values are skipped as in pd.DataFrame.mean
+        valid = ~np.isnan(values)
+        sums = np.zeros((len(values) + 1, values.shape[1]))
+        counts = np.zeros((len(values) + 1, values.shape[1]))
+        np.cumsum(np.where(valid, values, 0), axis=0, out=sums[1:])
+        np.cumsum(valid, axis=0, out=counts[1:])
+
+        starts, ends = list(starts), list(ends)
+        upper = np.array([end if end and not np.isnan(end) else np.inf for end in ends], dtype=np.float64)
+        lower = np.searchsorted(timestamps, np.asarray(starts, dtype=np.float64), side='left')
+        upper = np.maximum(np.searchsorted(timestamps, upper, side='left'), lower)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (sums[upper] - sums[lower]) / (counts[upper] - counts[lower])
 
 
 class BimodalFeatures(Features):
@@ -87,51 +418,116 @@ class BimodalFeatures(Features):
                      at least #starttime and #endtime columns of each chunk.
 
         For accomplish an analysis, the following requirements must be met.
-        - One audio file per utterance
+        - One audio file per utterance, or a single audio file with every utterance
         - One video file
         - A DataFrame with transcriptions whose column must be named 'transcription'
+
+        The features of each modality are computed only once per instance, so the same
+        instance can be used for every combination of modalities.
+
+        :param video_options: keyword arguments for the VideoAnalyzer
+        :param audio_options: keyword arguments for AudioFeatures
+        :param workers: number of processes used to extract audio features in parallel
     """
 
-    def __init__(self, df, **kwargs):
+    def __init__(self, df, video_options=None, audio_options=None, workers=1, **kwargs):
         if not '#starttime' in df.columns or not '#endtime' in df.columns:
             raise Exception('Some columns are missing in bounds file')
         self.bounds = df[['#starttime', '#endtime']]
+        self.video_options = video_options or {}
+        self.audio_options = audio_options or {}
+        self.workers = workers or 1
+        # Sources whose features have already been computed, by modality
+        self.sources = {}
         logger.info('Bounds file configured succesfully!')
         super().__init__(**kwargs)
 
+    def computed(self, modality, source):
+        """Whether the features of a modality have already been computed for the given source"""
+        return modality in self.sources and self.sources[modality] == source
+
+    def select(self, *modalities):
+        """
+            Concatenate the features already computed for the given modalities, in the given order.
+            Audio and video features are converted to a pd.DataFrame only here, for the models.
+
+            **Example**::
+
+                bf.run_audio(audio_files).run_video(video_file)
+                ft = bf.select('audio', 'video')
+        """
+        missing = [modality for modality in modalities if modality not in self.sources]
+        if missing:
+            raise Exception('Features for {} have not been computed'.format(', '.join(missing)))
+        features = [getattr(self, modality) for modality in modalities]
+        return pd.concat([ft.to_frame() if isinstance(ft, FeatureFrame) else ft for ft in features], axis=1)
+
     def run_audio(self, files):
+        """
+            :param files: one WAV file per utterance, or a single WAV file with every utterance
+                          which is sliced using the bounds
+        """
+        if isinstance(files, str):
+            files = [files]
+        if self.computed('audio', tuple(files)):
+            return self
+        if len(files) == 1 and len(self.bounds) > 1:
+            self.audio = AudioFeatures(cache=self.cache, checkpoint=self.checkpoint, **self.audio_options).run_segments(
+                files[0], self.bounds['#starttime'], self.bounds['#endtime'], workers=self.workers)
+            self.sources['audio'] = tuple(files)
+            return self
         if len(files) != len(self.bounds):
             raise Exception('{} audio files are needed and {} were provided'.format(len(self.bounds), len(files)))
-        series = []
-        for file in files:
-            series.append(AudioFeatures().run(file))
-        self.audio = pd.concat([serie for serie in series], axis=1).transpose()
+        frame = FeatureFrame(Selector.AUDIO_COLUMNS, rows=len(files))
+        key = Checkpoint.key(files, kind='audio', **self.audio_options) if self.checkpoint is not None else None
+        done = self.restore('audio', key, frame)
+        pending = [index for index in range(len(files)) if not done[index]]
+        if self.workers > 1 and len(pending) > 1:
+            # Results are returned in the same order as the files
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(pending))) as executor:
+                rows = executor.map(audio_features, [files[i] for i in pending], [self.cache] * len(pending),
+                                    [self.audio_options] * len(pending))
+                for index, values in zip(pending, rows):
+                    frame[index] = values
+                    done[index] = True
+                    self.snapshot('audio', key, frame, done)
+        else:
+            for index in pending:
+                frame[index] = audio_features(files[index], self.cache, self.audio_options)
+                done[index] = True
+                self.snapshot('audio', key, frame, done)
+        self.snapshot('audio', key, frame, done, force=True)
+        self.audio = frame
+        self.sources['audio'] = tuple(files)
         return self
 
     def run_video(self, file):
-        series = []
-        features = VideoFeatures().run(file)
-        for start, end in zip(self.bounds['#starttime'], self.bounds['#endtime']):
-            series.append(VideoFeatures().synchronize(features, start, end))
-        self.video = pd.concat([serie for serie in series], axis=1).transpose()
+        if self.computed('video', file):
+            return self
+        intervals = list(zip(self.bounds['#starttime'], self.bounds['#endtime']))
+        features = VideoFeatures(cache=self.cache, checkpoint=self.checkpoint, **self.video_options).run(
+            file, intervals=intervals)
+        self.video = VideoFeatures.synchronize_frame(features, self.bounds['#starttime'], self.bounds['#endtime'])
+        self.sources['video'] = file
         return self
 
     def run_text(self, df):
         self.text = df['transcription']
+        self.sources['text'] = id(df)
         return self
 
-    def run(self, modalities, text=None, audio=None, video=None):
+    def run(self, modalities, text=None, audio_files=None, video_file=None):
         if len(modalities) != 2:
             raise Exception('length of modalities is {} and must be 2'.format(len(modalities)))
         if 'text' in modalities and 'audio' in modalities:
-            self.run_text(text).run_audio(audio)
-            return pd.concat([self.text, self.audio], axis=1)
+            self.run_text(text).run_audio(audio_files)
+            return self.select('text', 'audio')
         elif 'audio' in modalities and 'video' in modalities:
-            self.run_audio(audio).run_video(video)
-            return pd.concat([self.audio, self.video], axis=1)
+            self.run_audio(audio_files).run_video(video_file)
+            return self.select('audio', 'video')
         elif 'video' in modalities and 'text' in modalities:
-            self.run_video(video).run_text(text)
-            return pd.concat([self.video, self.text], axis=1)
+            self.run_video(video_file).run_text(text)
+            return self.select('video', 'text')
         else:
             raise Exception('This combination of modalities are not supported!')
 
@@ -149,9 +545,9 @@ class MultimodalFeatures(BimodalFeatures):
         - A DataFrame with transcriptions whose column must be named 'transcription'
     """
 
-    def __init__(self, df, **kwargs):
-        super().__init__(df, **kwargs)
+    def __init__(self, df, video_options=None, audio_options=None, workers=1, **kwargs):
+        super().__init__(df, video_options=video_options, audio_options=audio_options, workers=workers, **kwargs)
 
-    def run(self, text=None, audio=None, video=None):
-        self.run_text(text).run_audio(audio).run_video(video)
-        return pd.concat([self.text, self.audio, self.video], axis=1)
+    def run(self, text=None, audio_files=None, video_file=None):
+        self.run_text(text).run_audio(audio_files).run_video(video_file)
+        return self.select('text', 'audio', 'video')
@@ -2,9 +2,8 @@ import cv2
 import logging
 import numpy as np
 import json
-from keras.models import load_model
-from pkg_resources import resource_filename
-from scipy import misc
+from .metrics import metrics
+from .registry import registry
 
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -16,6 +15,9 @@ class FERModel:
 
     :param target_emotions: set of target emotions to classify
     :param verbose: if true, will print out extra process information
+    :param reuse_threshold: if given, the prediction of the last image classified by the network is
+                            reused for the next images while the mean absolute difference of their
+                            12x12 downsampled 48x48 grayscale images (0-255) is not above it
 
     **Example**::
 
@@ -28,27 +30,36 @@ class FERModel:
 
     POSSIBLE_EMOTIONS = ['anger', 'fear', 'calm', 'sadness', 'happiness', 'surprise', 'disgust']
 
-    def __init__(self, target_emotions, verbose=False):
+    EMOTION_INDEX_MAP = {
+        'anger': 0,
+        'disgust': 1,
+        'fear': 2,
+        'happiness': 3,
+        'sadness': 4,
+        'surprise': 5,
+        'calm': 6
+    }
+
+    def __init__(self, target_emotions, verbose=False, reuse_threshold=None):
         self.target_emotions = target_emotions
-        self.emotion_index_map = {
-            'anger': 0,
-            'disgust': 1,
-            'fear': 2,
-            'happiness': 3,
-            'sadness': 4,
-            'surprise': 5,
-            'calm': 6
-        }
+        self.emotion_index_map = self.EMOTION_INDEX_MAP
         self._check_emotion_set_is_supported()
         self.verbose = verbose
         self.target_dimensions = (48, 48)
         self.channels = 1
+        self.reuse_threshold = reuse_threshold
+        # Signature and prediction of the last image classified by the network
+        self.reference = None
+        self.hits, self.misses = 0, 0
         self._initialize_model()
 
     def _initialize_model(self):
         # logger.info('Initializing FER model parameters for target emotions: %s' % self.target_emotions)
         logger.info('Initializing FER model parameters')
-        self.model, self.emotion_map = self._choose_model_from_target_emotions()
+        # Keras models are loaded once per process and shared by every FERModel
+        name = 'fer_' + self._model_suffix()
+        registry.register(name, self._choose_model_from_target_emotions, replace=False)
+        self.model, self.emotion_map, self.graph = registry.get(name)
 
     def predict(self, image):
         """
@@ -56,15 +67,79 @@ class FERModel:
 
         :param images: image file (jpg or png format)
         """
-        # image = misc.imread(image_file)
-        gray_image = image
-        if len(image.shape) > 2:
-            gray_image = cv2.cvtColor(image, code=cv2.COLOR_BGR2GRAY)
-        resized_image = cv2.resize(gray_image, self.target_dimensions, interpolation=cv2.INTER_LINEAR)
-        final_image = np.array([np.array([resized_image]).reshape(list(self.target_dimensions)+[self.channels])])
-        prediction = self.model.predict(final_image)
-        # self._print_prediction(prediction[0])
-        return prediction[0]
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images):
+        """
+        Predicts discrete emotions for several images in a single forward pass.
+
+        :param images: list of images (BGR or grayscale) of any size
+        :return: array with one prediction per image
+        """
+        batch = self.preprocess(images)
+        if len(batch) == 0:
+            return np.empty((0, len(self.target_emotions)))
+        if self.reuse_threshold is None:
+            return self._predict(batch)
+        return self._predict_reusing(batch)
+
+    def _predict(self, batch):
+        # The model may be used from threads other than the one which loaded it
+        with metrics.span('fer', items=len(batch)), self.graph.as_default():
+            return self.model.predict(batch, batch_size=len(batch))
+
+    def _predict_reusing(self, batch):
+        """
+        Predictions of a preprocessed batch where only the images which differ from the last
+        classified one are sent to the network.
+        """
+        reference, previous = self.reference if self.reference is not None else (None, None)
+        # Image whose prediction is used for each image, -1 for the reference of the previous batch
+        sources, inferred = [], []
+        for index, image in enumerate(batch):
+            signature = self.signature(image)
+            if reference is None or np.mean(np.abs(signature - reference)) > self.reuse_threshold:
+                reference = signature
+                inferred.append(index)
+            sources.append(inferred[-1] if inferred else -1)
+        self.hits += len(batch) - len(inferred)
+        self.misses += len(inferred)
+        metrics.increment('fer_cache_hits', len(batch) - len(inferred))
+        metrics.increment('fer_cache_misses', len(inferred))
+        if not inferred:
+            return np.array([previous] * len(batch))
+        predictions = dict(zip(inferred, self._predict(batch[inferred])))
+        self.reference = (reference, predictions[inferred[-1]])
+        return np.array([predictions[source] if source >= 0 else previous for source in sources])
+
+    def signature(self, image):
+        """
+        Cheap signature of a preprocessed image: the means of its 4x4 blocks.
+
+        :param image: (48, 48, 1) array, as returned by preprocess
+        """
+        height, width = self.target_dimensions
+        return image.reshape(height // 4, 4, width // 4, 4).mean(axis=(1, 3))
+
+    def hit_rate(self):
+        """Fraction of the images whose prediction has been reused, or None if none has been predicted"""
+        total = self.hits + self.misses
+        return self.hits / total if total else None
+
+    def preprocess(self, images):
+        """
+        Converts images to grayscale and resizes them into one contiguous (N, 48, 48, 1) array.
+
+        :param images: list of images (BGR or grayscale) of any size
+        """
+        batch = np.empty([len(images)] + list(self.target_dimensions) + [self.channels], dtype=np.float32)
+        for index, image in enumerate(images):
+            gray_image = image
+            if len(image.shape) > 2:
+                gray_image = cv2.cvtColor(image, code=cv2.COLOR_BGR2GRAY)
+            resized_image = cv2.resize(gray_image, self.target_dimensions, interpolation=cv2.INTER_LINEAR)
+            batch[index] = resized_image.reshape(list(self.target_dimensions) + [self.channels])
+        return batch
 
     def _check_emotion_set_is_supported(self):
         """
@@ -91,14 +166,35 @@ class FERModel:
             error_string += possible_subset_string
             raise ValueError(error_string)
 
+    def _model_suffix(self):
+        return self.model_suffix(self.target_emotions)
+
+    @classmethod
+    def model_suffix(cls, target_emotions):
+        model_indices = [cls.EMOTION_INDEX_MAP[emotion] for emotion in target_emotions]
+        sorted_indices = [str(idx) for idx in sorted(model_indices)]
+        return ''.join(sorted_indices)
+
+    @classmethod
+    def model_files(cls, target_emotions):
+        """
+        Paths of the EmoPy model and emotion map files used for a set of target emotions, without loading them.
+        """
+        from pkg_resources import resource_filename
+        model_suffix = cls.model_suffix(target_emotions)
+        return [resource_filename('EmoPy', 'models/conv_model_%s.hdf5' % model_suffix),
+                resource_filename('EmoPy', 'models/conv_emotion_map_%s.json' % model_suffix)]
+
     def _choose_model_from_target_emotions(self):
         """
         Initializes pre-trained deep learning model for the set of target emotions supplied by user.
         """
-        model_indices = [self.emotion_index_map[emotion] for emotion in self.target_emotions]
-        sorted_indices = [str(idx) for idx in sorted(model_indices)]
-        model_suffix = ''.join(sorted_indices)
-        model_file = 'models/conv_model_%s.hdf5' % model_suffix
-        emotion_map_file = 'models/conv_emotion_map_%s.json' % model_suffix
-        emotion_map = json.loads(open(resource_filename('EmoPy',emotion_map_file)).read())
-        return load_model(resource_filename('EmoPy',model_file)), emotion_map
+        # Keras and TensorFlow are only imported when a FER model is needed
+        import tensorflow as tf
+        from keras.models import load_model
+        model_file, emotion_map_file = self.model_files(self.target_emotions)
+        emotion_map = json.loads(open(emotion_map_file).read())
+        model = load_model(model_file)
+        # Build the predict function now so that it can be shared between threads
+        model._make_predict_function()
+        return model, emotion_map, tf.get_default_graph()
@@ -0,0 +1,99 @@
+import logging
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class FeatureFrame:
+    """
+        Numeric features with a fixed schema stored in a preallocated float32 array, one row
+        per frame or utterance. Rows are written in place, and the array only grows when more
+        rows are appended than expected. It is converted to a pd.DataFrame only where the
+        models need one.
+
+        :param columns: names of the feature columns, e.g. Selector.AUDIO_COLUMNS
+        :param rows: number of rows, which are NaN until they are written
+        :param capacity: number of rows preallocated for append
+        :param index: name of a float64 column stored apart from the features (e.g. timestamp),
+                      so that its precision is not reduced
+
+        **Example**::
+
+            frame = FeatureFrame(Selector.VIDEO_COLUMNS, capacity=nframes, index='timestamp')
+            for timestamp, emotions in records:
+                frame.append(emotions, timestamp)
+            df = frame.to_frame()
+    """
+
+    def __init__(self, columns, rows=0, capacity=0, index=None, dtype=np.float32):
+        self.columns = list(columns)
+        self.index_name = index
+        self._values = np.full((max(rows, capacity), len(self.columns)), np.nan, dtype=dtype)
+        self._index = np.full(len(self._values), np.nan) if index is not None else None
+        self._rows = rows
+
+    def __len__(self):
+        return self._rows
+
+    def __getitem__(self, key):
+        """Row (or rows) by position, or column by name"""
+        if isinstance(key, str):
+            if key == self.index_name:
+                return self.index
+            return self.values[:, self.columns.index(key)]
+        return self.values[key]
+
+    def __setitem__(self, row, values):
+        self.values[row] = values
+
+    @property
+    def values(self):
+        """View of the features, one row per frame or utterance"""
+        return self._values[:self._rows]
+
+    @property
+    def index(self):
+        """View of the index column, or None"""
+        return self._index[:self._rows] if self._index is not None else None
+
+    def append(self, values, index=None):
+        """Write the next row, doubling the preallocated rows if they are exhausted"""
+        if self._rows == len(self._values):
+            capacity = max(2 * len(self._values), 1)
+            self._values = np.resize(self._values, (capacity, len(self.columns)))
+            if self._index is not None:
+                self._index = np.resize(self._index, capacity)
+        self._values[self._rows] = values
+        if self._index is not None:
+            self._index[self._rows] = index
+        self._rows += 1
+
+    def trim(self):
+        """Release the preallocated rows which have not been written"""
+        self._values = self._values[:self._rows].copy()
+        if self._index is not None:
+            self._index = self._index[:self._rows].copy()
+        return self
+
+    def to_frame(self, index=True):
+        """
+            pd.DataFrame with the features and, if index is true, the index column after them
+
+            :param index: include the index column
+        """
+        df = pd.DataFrame(self.values, columns=self.columns)
+        if index and self._index is not None:
+            df[self.index_name] = self.index
+        return df
+
+    @classmethod
+    def from_frame(cls, df, index=None, dtype=np.float32):
+        """FeatureFrame with the columns of a pd.DataFrame. The index column is kept apart."""
+        columns = [column for column in df.columns if column != index]
+        frame = cls(columns, rows=len(df), index=index, dtype=dtype)
+        frame.values[:] = df[columns].values
+        if index is not None:
+            frame.index[:] = df[index].values
+        return frame
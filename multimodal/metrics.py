@@ -0,0 +1,208 @@
+import json
+import logging
+import random
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """Timing of a running span. The number of items processed (e.g. frames) can be updated"""
+
+    def __init__(self, path, items=1):
+        self.path = path
+        self.items = items
+        self.start = perf_counter()
+        self.elapsed = None
+
+
+class Stats:
+    """
+        Aggregated timings of a span: calls, items, total time and a bounded reservoir
+        of durations for the percentiles.
+    """
+
+    def __init__(self, samples=1024):
+        self.samples = samples
+        self.calls = 0
+        self.items = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+        self.durations = []
+
+    def add(self, elapsed, items=1):
+        self.calls += 1
+        self.items += items
+        self.total += elapsed
+        self.min = min(self.min, elapsed)
+        self.max = max(self.max, elapsed)
+        # Reservoir sampling keeps a uniform sample of every duration in bounded memory
+        if len(self.durations) < self.samples:
+            self.durations.append(elapsed)
+        else:
+            index = random.randrange(self.calls)
+            if index < self.samples:
+                self.durations[index] = elapsed
+
+    def percentile(self, q):
+        if not self.durations:
+            return None
+        durations = sorted(self.durations)
+        return durations[min(int(q * len(durations)), len(durations) - 1)]
+
+    def summary(self, quantiles):
+        summary = {
+            'calls': self.calls,
+            'items': self.items,
+            'total': self.total,
+            'mean': self.total / self.calls if self.calls else None,
+            'min': self.min if self.calls else None,
+            'max': self.max,
+            # Items per second, e.g. frames per second of the decoding
+            'rate': self.items / self.total if self.total > 0 else None
+        }
+        for q in quantiles:
+            summary['p{}'.format(int(q * 100))] = self.percentile(q)
+        return summary
+
+
+class Metrics:
+    """
+        Process-wide metrics of the analysis stages.
+
+        Spans measure the time of a stage and nest within the same thread, so that a span
+        named 'decode' opened inside the span 'video' is recorded as 'video/decode'. Counters
+        count events such as cache hits. Both can be exported as JSON or in the Prometheus
+        text format.
+
+        **Example**::
+
+            with metrics.span('video') as span:
+                for frame in frames:
+                    with metrics.span('detect'):
+                        detect(frame)
+                span.items = len(frames)
+            metrics.save('metrics.json')
+    """
+
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self, samples=1024):
+        self.samples = samples
+        self._spans = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self):
+        """Path of the innermost span open in this thread, or None"""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def attach(self, path):
+        """Nest the spans of this thread inside a span of another thread, e.g. a worker thread"""
+        stack = self._stack()
+        if path is not None:
+            stack.append(path)
+        try:
+            yield
+        finally:
+            if path is not None:
+                stack.pop()
+
+    @contextmanager
+    def span(self, name, items=1):
+        """
+            Measure the time of a block of code.
+
+            :param name: name of the stage
+            :param items: number of items processed by the block, used for the rate
+        """
+        stack = self._stack()
+        span = Span(stack[-1] + '/' + name if stack else name, items)
+        stack.append(span.path)
+        try:
+            yield span
+        finally:
+            stack.pop()
+            span.elapsed = perf_counter() - span.start
+            self.record(span.path, span.elapsed, span.items)
+
+    def record(self, path, elapsed, items=1):
+        """Record a duration measured elsewhere"""
+        with self._lock:
+            if path not in self._spans:
+                self._spans[path] = Stats(self.samples)
+            self._spans[path].add(elapsed, items)
+
+    def increment(self, name, value=1):
+        """Increment a counter"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def reset(self):
+        """Remove every span and counter"""
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+
+    def summary(self):
+        """Dictionary with the statistics of each span and the value of each counter"""
+        with self._lock:
+            return {
+                'spans': {path: stats.summary(self.QUANTILES) for path, stats in sorted(self._spans.items())},
+                'counters': dict(sorted(self._counters.items()))
+            }
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        def label(value):
+            return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        def number(value):
+            return 'NaN' if value is None else repr(float(value))
+
+        summary = self.summary()
+        lines = ['# HELP multimodal_span_seconds Time spent in each stage of the analysis',
+                 '# TYPE multimodal_span_seconds summary']
+        for path, stats in summary['spans'].items():
+            for q in self.QUANTILES:
+                lines.append('multimodal_span_seconds{{span="{}",quantile="{}"}} {}'.format(
+                    label(path), q, number(stats['p{}'.format(int(q * 100))])))
+            lines.append('multimodal_span_seconds_sum{{span="{}"}} {}'.format(label(path), number(stats['total'])))
+            lines.append('multimodal_span_seconds_count{{span="{}"}} {}'.format(label(path), stats['calls']))
+        lines += ['# HELP multimodal_span_items_total Items processed in each stage of the analysis',
+                  '# TYPE multimodal_span_items_total counter']
+        for path, stats in summary['spans'].items():
+            lines.append('multimodal_span_items_total{{span="{}"}} {}'.format(label(path), stats['items']))
+        lines += ['# HELP multimodal_events_total Events counted during the analysis',
+                  '# TYPE multimodal_events_total counter']
+        for name, value in summary['counters'].items():
+            lines.append('multimodal_events_total{{name="{}"}} {}'.format(label(name), value))
+        return '\n'.join(lines) + '\n'
+
+    def save(self, file):
+        """Write the metrics to a file, in Prometheus format if its extension is .prom and in JSON otherwise"""
+        with open(file, 'w') as stream:
+            stream.write(self.to_prometheus() if file.endswith('.prom') else self.to_json())
+        logger.info('Metrics saved to {}'.format(file))
+
+
+metrics = Metrics()
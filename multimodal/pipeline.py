@@ -0,0 +1,185 @@
+import glob
+import logging
+import os
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from . import analyzer
+from . import features
+from .metrics import metrics
+from .registry import registry
+from .utils import timer
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+MODALITIES = ['text', 'audio', 'video']
+
+
+def models(modalities):
+    """Names of the sklearn pipelines used by analyze for the given modalities and their combinations"""
+    names = [modality for modality in MODALITIES if modality in modalities]
+    for pair in (('text', 'audio'), ('audio', 'video'), ('video', 'text')):
+        if all(modality in modalities for modality in pair):
+            names.append('_'.join(pair))
+    if all(modality in modalities for modality in MODALITIES):
+        names.append('multimodal')
+    return names
+
+
+def warmup(emotions=['anger', 'happiness', 'calm'], modalities=MODALITIES):
+    """
+        Load the pretrained models needed to analyze the given modalities (all of them by default):
+        sklearn pipelines, arousal and valence SVMs for audio and FER model for video.
+    """
+    with timer('Models loading', logger.info):
+        registry.warmup(models(modalities))
+        if 'audio' in modalities:
+            for key in features.AudioFeatures.regression_models().values():
+                registry.get(key)
+        if 'video' in modalities:
+            from .fermodel import FERModel
+            FERModel(emotions)
+
+
+def load_sources(bounds=None, text=None, audio=None, audio_dir=None, video=None):
+    """
+        Read the source files of an analysis.
+
+        :param bounds: path of the bounds CSV file
+        :param text: path of the transcriptions CSV file
+        :param audio: list of WAV files, one per utterance
+        :param audio_dir: directory with the WAV files, exclusive with audio
+        :param video: path of the MP4 file
+        :return: dictionary with the arguments for analyze
+    """
+    if audio is not None and audio_dir is not None:
+        raise Exception('Cannot use audio and audio_dir at the same time')
+    if audio_dir is not None:
+        audio = glob.glob(os.path.join(audio_dir, '*.wav'))
+    return {
+        'bounds': pd.read_csv(bounds, sep=';') if bounds is not None else None,
+        'text': pd.read_csv(text, sep=';') if text is not None else None,
+        'audio': sorted(audio) if audio is not None else None,
+        'video': video
+    }
+
+
+def analyze(bounds=None, text=None, audio=None, video=None, video_options=None, audio_options=None, workers=1,
+            cache=None, concurrent=False, checkpoint=None):
+    """
+        Compute every analysis available for the given sources: each modality on its own,
+        each pair of modalities and the three of them.
+
+        :param bounds: pd.DataFrame with the bounds of each utterance
+        :param text: pd.DataFrame with the transcription of each utterance
+        :param audio: sorted list of WAV files, one per utterance
+        :param video: path of the MP4 file
+        :param video_options: keyword arguments for the VideoAnalyzer
+        :param audio_options: keyword arguments for AudioFeatures (extractor)
+        :param workers: number of processes used to extract audio features
+        :param cache: FeatureCache used for audio and video features
+        :param concurrent: analyze the modalities at the same time, each one in its own thread.
+                           Each analysis of several modalities starts as soon as they are ready.
+        :param checkpoint: Checkpoint where audio and video features are saved periodically, so that
+                           an interrupted analysis resumes where it stopped
+        :return: dictionary with the predictions of each analysis
+    """
+    if (audio is not None or text is not None) and bounds is None:
+        raise Exception('A bounds file is needed for perform an analysis')
+
+    video_options = video_options or {}
+
+    # Features of each modality are computed once and shared by every analysis
+    store = None
+    if bounds is not None:
+        store = features.MultimodalFeatures(bounds, video_options=video_options, audio_options=audio_options,
+                                               workers=workers, cache=cache, checkpoint=checkpoint)
+
+    def text_analysis():
+        store.run_text(text)
+        return list(analyzer.text_batch_analyzer(store.text))
+
+    def audio_analysis():
+        store.run_audio(audio)
+        return list(analyzer.audio_batch_analyzer(store.audio))
+
+    def video_analysis():
+        if bounds is None:
+            # Video analysis of each frame
+            ft = features.VideoFeatures(cache=cache, checkpoint=checkpoint, **video_options).run(video)
+            return list(analyzer.video_batch_analyzer(ft))
+        # Video analysis synchronized with the other sources
+        store.run_video(video)
+        return list(analyzer.video_batch_analyzer(store.video))
+
+    def bimodal_analysis(*mods):
+        return lambda: analyzer.bimodal_analyzer(store.select(*mods), mods)
+
+    def multimodal_analysis():
+        return analyzer.multimodal(store.select('text', 'audio', 'video'))
+
+    # Name, log message, analyses it depends on and function of each analysis
+    steps = []
+    if text is not None:
+        steps.append(('Text', 'Computing analysis for text...', [], text_analysis))
+    if audio is not None:
+        steps.append(('Audio', 'Computing analysis for audio...', [], audio_analysis))
+    if video is not None:
+        steps.append(('Video', 'Computing analysis for video...', [], video_analysis))
+    if text is not None and audio is not None:
+        steps.append(('Text + Audio', 'Computing analysis using two modalities: text + audio...', ['Text', 'Audio'],
+                      bimodal_analysis('text', 'audio')))
+    if audio is not None and video is not None:
+        steps.append(('Audio + Video', 'Computing analysis using two modalities: audio + video...', ['Audio', 'Video'],
+                      bimodal_analysis('audio', 'video')))
+    if video is not None and text is not None:
+        steps.append(('Video + Text', 'Computing analysis using two modalities: video + text...', ['Video', 'Text'],
+                      bimodal_analysis('video', 'text')))
+    if text is not None and audio is not None and video is not None:
+        steps.append(('Multimodal', 'Computing analysis using three modalities: text + audio + video...',
+                      ['Text', 'Audio', 'Video'], multimodal_analysis))
+
+    if concurrent and len(steps) > 1:
+        return run_concurrently(steps)
+    return {name: run_step(name, message, function) for name, message, _, function in steps}
+
+
+def run_step(name, message, function, dependencies=()):
+    """Run an analysis once the analyses it depends on (futures) are done"""
+    for dependency in dependencies:
+        # Raises the exception of the dependency, if any
+        dependency.result()
+    logger.info(message)
+    with timer('{} analysis'.format(name), logger.info), metrics.span(name):
+        return function()
+
+
+def run_concurrently(steps):
+    """
+        Run every analysis in its own thread. Analyses of several modalities wait for the
+        analyses of each modality, so the total time is close to the one of the slowest modality.
+
+        :param steps: list of (name, log message, dependencies, function) in order of dependency
+        :return: dictionary with the predictions of each analysis, in the same order as the steps
+    """
+    futures = {}
+    with ThreadPoolExecutor(max_workers=len(steps)) as executor:
+        for name, message, dependencies, function in steps:
+            futures[name] = executor.submit(run_step, name, message, function,
+                                            [futures[dependency] for dependency in dependencies])
+        return {name: future.result() for name, future in futures.items()}
+
+
+def summary(results, bounds):
+    """
+        Per-utterance predictions of each analysis and their majority, as shown in the
+        results table.
+
+        :return: dictionary with the end of each utterance and a row for each analysis
+    """
+    rows = []
+    for modality, values in results.items():
+        values = [int(x) for x in values]
+        rows.append({'modality': modality, 'values': values, 'majority': max(values, key=values.count)})
+    return {'utterances': ['%0.3f' % (end) for end in bounds['#endtime']], 'results': rows}
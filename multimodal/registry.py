@@ -0,0 +1,125 @@
+import logging
+import os
+import threading
+from time import time
+from .utils import lazy_import
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+path = os.path.dirname(os.path.abspath(__file__))
+
+joblib = lazy_import('sklearn.externals.joblib')
+
+
+class ModelRegistry:
+    """
+        Process-wide registry of pretrained models.
+        Each model is loaded once and shared by every caller until it is unloaded.
+
+        :param models: dictionary with the name of each model and the file where it is stored,
+                       or a function without arguments which loads it
+        :param mmap_mode: memory-map mode passed to joblib.load (None, 'r', 'r+', 'c')
+
+        **Example**::
+
+            registry = ModelRegistry({'text': 'models/text.pkl'})
+            registry.warmup()
+            pipeline = registry.get('text')
+    """
+
+    MODELS = {
+        'text': 'models/text.pkl',
+        'audio': 'models/audio.pkl',
+        'video': 'models/video.pkl',
+        'text_audio': 'models/text_audio.pkl',
+        'audio_video': 'models/audio_video.pkl',
+        'video_text': 'models/video_text.pkl',
+        'multimodal': 'models/multimodal.pkl'
+    }
+
+    def __init__(self, models=None, mmap_mode=None):
+        self.models = dict(models if models is not None else self.MODELS)
+        self.mmap_mode = mmap_mode
+        self._loaded = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _model_lock(self, name):
+        with self._lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _counters(self, name):
+        return self._stats.setdefault(name, {'hits': 0, 'misses': 0, 'loads': 0, 'load_time': 0.0})
+
+    def register(self, name, file, replace=True):
+        """Register a new model file (or loader function) under the given name"""
+        with self._lock:
+            if replace or name not in self.models:
+                self.models[name] = file
+
+    def get(self, name):
+        """Return the model with the given name, loading it if needed"""
+        if name not in self.models:
+            raise Exception('Model {} is not registered'.format(name))
+        with self._lock:
+            if name in self._loaded:
+                self._counters(name)['hits'] += 1
+                return self._loaded[name]
+        with self._model_lock(name):
+            # Another thread may have loaded it while waiting
+            with self._lock:
+                if name in self._loaded:
+                    self._counters(name)['hits'] += 1
+                    return self._loaded[name]
+                self._counters(name)['misses'] += 1
+            return self.load(name)
+
+    def load(self, name):
+        """Load (or reload) the model with the given name"""
+        file = self.models[name]
+        start = time()
+        if callable(file):
+            model = file()
+        else:
+            if not os.path.isabs(file):
+                file = os.path.join(path, file)
+            model = joblib.load(file, mmap_mode=self.mmap_mode)
+        elapsed = time() - start
+        logger.info('Model {} loaded in {} seconds'.format(name, elapsed))
+        with self._lock:
+            self._loaded[name] = model
+            counters = self._counters(name)
+            counters['loads'] += 1
+            counters['load_time'] += elapsed
+        return model
+
+    def warmup(self, names=None):
+        """Load the given models (all of them by default) ahead of time"""
+        for name in names if names is not None else self.models:
+            self.get(name)
+        return self
+
+    def unload(self, name):
+        """Evict a model from memory. It will be loaded again on next use"""
+        with self._lock:
+            return self._loaded.pop(name, None) is not None
+
+    def clear(self):
+        """Evict every model from memory"""
+        with self._lock:
+            self._loaded.clear()
+
+    def loaded(self):
+        """Names of the models currently in memory"""
+        with self._lock:
+            return sorted(self._loaded)
+
+    def stats(self):
+        """Hits, misses, number of loads and load time of each model"""
+        with self._lock:
+            return {name: dict(counters) for name, counters in self._stats.items()}
+
+
+registry = ModelRegistry(mmap_mode=os.environ.get('MULTIMODAL_MMAP') or None)
@@ -6,6 +6,16 @@ logger = logging.getLogger(__name__)
 class Selector:
     """Features selector for diferent features based on data."""
 
+    AUDIO_COLUMNS = ['zcr','energy','energy_entropy','spectral_centroid','spectral_spread','spectral_entropy','spectral_flux',
+                     'spectral_rolloff','mfcc_1','mfcc_2','mfcc_3','mfcc_4','mfcc_5','mfcc_6','mfcc_7','mfcc_8','mfcc_9',
+                     'mfcc_10','mfcc_11','mfcc_12','mfcc_13','chroma_1','chroma_2','chroma_3','chroma_4','chroma_5','chroma_6',
+                     'chroma_7','chroma_8','chroma_9','chroma_10','chroma_11','chroma_12','chroma_std','arousal','valence']
+
+    VIDEO_COLUMNS = ['anger','calm','happiness']
+
+    # The video model reads its features by position, in the order of the emotions it was trained with
+    VIDEO_MODEL_COLUMNS = ['anger','happiness','calm']
+
     def __init__(self):
         pass
 
@@ -23,14 +33,9 @@ class Selector:
     @staticmethod
     def audio(df):
         """Audio features selector"""
-        columns = ['zcr','energy','energy_entropy','spectral_centroid','spectral_spread','spectral_entropy','spectral_flux',
-                   'spectral_rolloff','mfcc_1','mfcc_2','mfcc_3','mfcc_4','mfcc_5','mfcc_6','mfcc_7','mfcc_8','mfcc_9',
-                   'mfcc_10','mfcc_11','mfcc_12','mfcc_13','chroma_1','chroma_2','chroma_3','chroma_4','chroma_5','chroma_6',
-                   'chroma_7','chroma_8','chroma_9','chroma_10','chroma_11','chroma_12','chroma_std','arousal','valence']
-        return df[columns]
+        return df[Selector.AUDIO_COLUMNS]
 
     @staticmethod
     def video(df):
         """Video features selector"""
-        columns = ['anger','calm','happiness']
-        return df[columns]
+        return df[Selector.VIDEO_COLUMNS]
@@ -0,0 +1,214 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import socketserver
+import threading
+import traceback
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+from . import pipeline
+from .metrics import metrics
+from .registry import registry
+from .utils import timer
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """
+        Bounded queue of analysis jobs consumed by a pool of worker threads.
+
+        :param concurrency: number of jobs analyzed at the same time
+        :param size: maximum number of jobs waiting to be analyzed
+        :param history: maximum number of finished jobs kept with their results
+        :param options: keyword arguments for pipeline.analyze (video_options, workers, cache)
+    """
+
+    def __init__(self, concurrency=1, size=16, history=1000, **options):
+        self.options = options
+        self.history = history
+        self.jobs = OrderedDict()
+        self._queue = queue.Queue(maxsize=size)
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(concurrency)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, sources):
+        """Queue a job and return its id, or None if the queue is full"""
+        job = {'id': uuid.uuid4().hex, 'status': 'queued', 'sources': sources}
+        with self._lock:
+            self.jobs[job['id']] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self.jobs[job['id']]
+            return None
+        return job['id']
+
+    def get(self, id):
+        """Job with the given id or None"""
+        with self._lock:
+            job = self.jobs.get(id)
+            return {k: v for k, v in job.items() if k != 'sources'} if job is not None else None
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job['status'] = 'running'
+            try:
+                sources = pipeline.load_sources(**job['sources'])
+                with timer('Job {}'.format(job['id']), logger.info):
+                    results = pipeline.analyze(**dict(self.options, **sources))
+                if sources['bounds'] is not None:
+                    job['results'] = pipeline.summary(results, sources['bounds'])
+                else:
+                    job['results'] = {k: [float(x) for x in v] for k, v in results.items()}
+                job['status'] = 'done'
+            except Exception as e:
+                logger.warning('Job {} failed: {}'.format(job['id'], e))
+                logger.debug(traceback.format_exc())
+                job['status'], job['error'] = 'failed', str(e)
+            finally:
+                self._queue.task_done()
+                self._forget()
+
+    def _forget(self):
+        """Remove the oldest finished jobs above the history size"""
+        with self._lock:
+            finished = [id for id, job in self.jobs.items() if job['status'] in ('done', 'failed')]
+            for id in finished[:max(len(finished) - self.history, 0)]:
+                del self.jobs[id]
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+        HTTP API of the analysis server.
+
+        - POST /jobs with a JSON object with bounds, text, audio or audio_dir and video paths
+        - GET /jobs/<id> with the status and results of a job
+        - GET /health with the loaded models and the number of pending jobs
+        - GET /metrics with the metrics of every stage in Prometheus format, or in JSON with ?format=json
+    """
+
+    SOURCES = ['bounds', 'text', 'audio', 'audio_dir', 'video']
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_text(self, status, text):
+        data = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/metrics':
+            if parse_qs(url.query).get('format') == ['json']:
+                self._send(200, metrics.summary())
+            else:
+                self._send_text(200, metrics.to_prometheus())
+        elif url.path == '/health':
+            self._send(200, {'models': registry.loaded(), 'stats': registry.stats(), 'pending': self.server.jobs.pending()})
+        elif url.path.startswith('/jobs/'):
+            job = self.server.jobs.get(url.path[len('/jobs/'):])
+            if job is not None:
+                self._send(200, job)
+            else:
+                self._send(404, {'error': 'Job not found'})
+        else:
+            self._send(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            return self._send(404, {'error': 'Not found'})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+            sources = {source: body.get(source) for source in self.SOURCES}
+        except (ValueError, AttributeError):
+            return self._send(400, {'error': 'Body must be a JSON object'})
+        if all(value is None for value in sources.values()):
+            return self._send(400, {'error': 'At least one source is needed'})
+        id = self.server.jobs.submit(sources)
+        if id is None:
+            return self._send(503, {'error': 'Job queue is full'})
+        self._send(202, {'id': id})
+
+    def address_string(self):
+        # Unix sockets have no client address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class AnalysisServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, jobs):
+        self.jobs = jobs
+        super().__init__(address, RequestHandler)
+
+
+class UnixAnalysisServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, address, jobs):
+        self.jobs = jobs
+        super().__init__(address, RequestHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analysis server which keeps the pretrained models loaded')
+    parser.add_argument('--host', help='Host to listen on (default: 127.0.0.1)', default='127.0.0.1')
+    parser.add_argument('--port', help='Port to listen on (default: 8080)', type=int, default=8080)
+    parser.add_argument('--socket', help='Unix socket to listen on instead of host and port')
+    parser.add_argument('--workers', help='Number of jobs analyzed at the same time (default: 1)', type=int, default=1)
+    parser.add_argument('--queue-size', help='Maximum number of jobs waiting to be analyzed (default: 16)',
+                        type=int, default=16)
+    parser.add_argument('--audio-workers', help='Number of processes used to extract audio features (default: 1)',
+                        type=int, default=1)
+    parser.add_argument('--fps', help='Analyze the videos at this frame rate instead of every frame', type=float)
+    parser.add_argument('--no-cache', help='Do not read or write the features cache', action='store_true')
+    args = parser.parse_args()
+
+    from .cache import FeatureCache
+    pipeline.warmup()
+    jobs = JobQueue(concurrency=args.workers, size=args.queue_size, video_options={'sample_rate': args.fps},
+                    workers=args.audio_workers, cache=None if args.no_cache else FeatureCache())
+
+    if args.socket is not None:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixAnalysisServer(args.socket, jobs)
+        logger.info('Listening on {}'.format(args.socket))
+    else:
+        server = AnalysisServer((args.host, args.port), jobs)
+        logger.info('Listening on {}:{}'.format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
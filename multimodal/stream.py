@@ -0,0 +1,408 @@
+import cv2
+import logging
+import numpy as np
+import os
+import pandas as pd
+import queue
+import struct
+import threading
+from time import sleep, time
+from . import analyzer
+from .audio import mono
+from .features import AudioFeatures
+from .metrics import metrics
+from .selector import Selector
+from .video import VideoAnalyzer
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class LiveVideoAnalyzer(VideoAnalyzer):
+    """
+        Per-frame emotion recognition on a video which may still be being written, or on a
+        device or stream opened by OpenCV. New frames are polled until no frame arrives for
+        timeout seconds, or until every interval has been analyzed.
+
+        Files must be in a format which can be read while they are written (e.g. MKV, MPEG-TS
+        or fragmented MP4).
+
+        Once every frame before the end of an interval has been read, the frames waiting to be
+        classified are classified without waiting for a whole batch, and stream yields a record
+        without emotions (None) with the timestamp reached, even between intervals.
+
+        :param classifier: path of the cascade classifier XML file
+        :param source: video file, device index or URL
+        :param fps: frame rate used if the source does not report it
+        :param poll: seconds to wait before trying to read new frames
+        :param timeout: seconds without new frames after which the video is finished
+        :param follow: if false, the video is finished at the first frame which cannot be read
+
+        Any other keyword argument is passed to the VideoAnalyzer.
+    """
+
+    def __init__(self, classifier, source, fps=30, poll=0.5, timeout=10, follow=True, verbose=False, **kwargs):
+        self.source = source
+        self.default_fps = fps
+        self.poll = poll
+        self.timeout = timeout
+        self.follow = follow
+        super().__init__(classifier, source, verbose=verbose, **kwargs)
+
+    def open(self, source, position=0):
+        """Open the source, waiting for it to exist, and seek the given frame if it is a file"""
+        start = time()
+        while True:
+            video = cv2.VideoCapture(source)
+            if video.isOpened():
+                break
+            video.release()
+            if not self.follow or time() - start > self.timeout:
+                raise Exception('Video source {} cannot be opened'.format(source))
+            sleep(self.poll)
+        if position > 0:
+            video.set(cv2.CAP_PROP_POS_FRAMES, position)
+        self.width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = video.get(cv2.CAP_PROP_FPS)
+        self.fps = round(fps) if fps and fps == fps and fps > 0 else self.default_fps
+        # Number of frames is unknown while the video is being written
+        self.nframes = 0
+        return video
+
+    def frames(self, intervals=None, from_frame=0):
+        """
+            Frames generator yielding (index, frame) tuples as they are available. Frames
+            out of the intervals or above the sample rate are skipped without being retrieved.
+            When the frame where an interval ends is reached, (index, None) is yielded once
+            every frame before it has been yielded. Live sources are always read from their
+            first frame.
+        """
+        if from_frame:
+            raise Exception('Live video analysis cannot be resumed')
+        ranges = self.ranges(intervals)
+        # First frame after each interval, which may be inside a merged range
+        ends = sorted(set(self.first_frame(end) for _, end in intervals or [] if end and not np.isnan(end)))
+        # Frame after the last interval, or None if it lasts until the end of the video
+        last = max(end for _, end in ranges) if all(end is not None for _, end in ranges) else None
+        step = max(self.fps / self.sample_rate, 1) if self.sample_rate else 1
+        position, sample, received = 0, 0, time()
+        # Last frame of a file being written may be incomplete, so it is only yielded once
+        # the next frame has been written: (index, frame, sample before it)
+        held = None
+        while last is None or position < last:
+            with metrics.span('grab'):
+                success = self.target.grab()
+            if not success:
+                if not self.follow or time() - received > self.timeout:
+                    break
+                sleep(self.poll)
+                if isinstance(self.source, str):
+                    if held is not None:
+                        # Read the last frame again, now that it may be complete
+                        position, sample, held = held[0], held[2], None
+                    # Files being written must be opened again to see the new frames
+                    self.target.release()
+                    self.target = self.open(self.source, position)
+                continue
+            received = time()
+            if held is not None:
+                # The next frame has been written, so the held frame is complete
+                yield held[:2]
+                held = None
+            if ends and position >= ends[0]:
+                yield position, None
+                ends = [end for end in ends if end > position]
+            if any(start <= position and (end is None or position < end) for start, end in ranges) and \
+                    position >= round(sample):
+                with metrics.span('decode'):
+                    success, frame = self.target.retrieve()
+                if success and isinstance(self.source, str):
+                    held = (position, frame, sample)
+                elif success:
+                    yield position, frame
+                while round(sample) <= position:
+                    sample += step
+            position += 1
+        if held is not None:
+            yield held[:2]
+
+
+class LiveAudio:
+    """
+        Chunks of samples of a WAV file which may still be being written. The header is
+        read once and the samples are read as the file grows, so the data size written in
+        the header is not used.
+
+        :param file: WAV file (PCM)
+        :param chunk: duration of each chunk in seconds
+        :param poll: seconds to wait before trying to read new samples
+        :param timeout: seconds without new samples after which the file is finished
+        :param follow: if false, the file is finished at its current end
+    """
+
+    DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+    def __init__(self, file, chunk=0.5, poll=0.5, timeout=10, follow=True):
+        self.file = file
+        self.chunk = chunk
+        self.poll = poll
+        self.timeout = timeout
+        self.follow = follow
+        self.fs = None
+
+    def header(self, stream):
+        """Sampling rate, channels, sample width and offset of the samples, or None if incomplete"""
+        data = stream.read(12)
+        if len(data) < 12 or data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+            return None
+        fs = channels = width = None
+        while True:
+            chunk = stream.read(8)
+            if len(chunk) < 8:
+                return None
+            name, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+            if name == b'fmt ':
+                fmt = stream.read(size)
+                if len(fmt) < 16:
+                    return None
+                channels, fs = struct.unpack('<HI', fmt[2:8])
+                width = struct.unpack('<H', fmt[14:16])[0] // 8
+            elif name == b'data':
+                if fs is None:
+                    return None
+                return fs, channels, width, stream.tell()
+            else:
+                stream.seek(size + size % 2, os.SEEK_CUR)
+
+    def chunks(self):
+        """Generator of mono chunks of samples, as they are written"""
+        start = time()
+        while True:
+            if os.path.isfile(self.file):
+                with open(self.file, 'rb') as stream:
+                    header = self.header(stream)
+                if header is not None:
+                    break
+            if not self.follow or time() - start > self.timeout:
+                raise Exception('Audio file {} cannot be read'.format(self.file))
+            sleep(self.poll)
+        self.fs, channels, width, offset = header
+        if width not in self.DTYPES:
+            raise Exception('Sample width of {} bytes not supported'.format(width))
+        frame = channels * width
+        size = max(int(self.chunk * self.fs), 1) * frame
+        received = time()
+        with open(self.file, 'rb') as stream:
+            stream.seek(offset)
+            pending = b''
+            while True:
+                data = stream.read(size - len(pending))
+                if data:
+                    received = time()
+                    pending += data
+                    # Only whole frames are converted, the rest is kept for the next read
+                    if len(pending) >= size:
+                        yield self.samples(pending, channels, width)
+                        pending = b''
+                    continue
+                if not self.follow or time() - received > self.timeout:
+                    usable = len(pending) - len(pending) % frame
+                    if usable:
+                        yield self.samples(pending[:usable], channels, width)
+                    return
+                sleep(self.poll)
+
+    def samples(self, data, channels, width):
+        x = np.frombuffer(data, dtype=np.dtype(self.DTYPES[width]).newbyteorder('<'))
+        return mono(x.reshape(-1, channels)) if channels > 1 else x
+
+
+class LiveAnalysis:
+    """
+        Incremental analysis of recordings which are still being written. Frames and audio
+        chunks are consumed as they arrive and only running aggregates of each utterance are
+        kept: sums of the per-frame emotions and the samples of the utterances not finished yet.
+        The predictions of each utterance are emitted as soon as every modality has passed
+        its #endtime.
+
+        :param bounds: pd.DataFrame with #starttime and #endtime of each utterance
+        :param text: pd.DataFrame with the transcription of each utterance
+        :param audio: WAV file with every utterance
+        :param video: video file, device index or URL
+        :param video_options: keyword arguments for the LiveVideoAnalyzer
+        :param audio_options: keyword arguments for AudioFeatures (extractor)
+        :param poll: seconds to wait for new frames or samples
+        :param timeout: seconds without new frames or samples after which a source is finished
+
+        **Example**::
+
+            for utterance in LiveAnalysis(bounds, text, 'session.wav', 'session.mkv').run():
+                print(utterance['index'], utterance['results'])
+    """
+
+    def __init__(self, bounds, text=None, audio=None, video=None, video_options=None, audio_options=None, poll=0.5,
+                 timeout=10):
+        if not '#starttime' in bounds.columns or not '#endtime' in bounds.columns:
+            raise Exception('Some columns are missing in bounds file')
+        self.starts = [float(start) for start in bounds['#starttime']]
+        self.ends = [float(end) if end and not np.isnan(end) else None for end in bounds['#endtime']]
+        self.text = list(text['transcription']) if text is not None else None
+        self.audio = audio
+        self.video = video
+        self.video_options = video_options or {}
+        self.audio_options = audio_options or {}
+        self.poll = poll
+        self.timeout = timeout
+        self.classifier = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                       'models/haarcascade_frontalface_default.xml')
+
+    def modalities(self):
+        return [modality for modality in ('text', 'audio', 'video') if getattr(self, modality) is not None]
+
+    def run(self):
+        """
+            Generator of the results of each utterance, in order, as soon as they are available.
+            Each result is a dictionary with the index, start and end of the utterance and the
+            prediction of each analysis, as returned by pipeline.analyze.
+        """
+        events = queue.Queue()
+        stop = threading.Event()
+        threads = []
+        if self.video is not None:
+            threads.append(threading.Thread(target=self._worker, args=('video', self._video, events, stop), daemon=True))
+        if self.audio is not None:
+            threads.append(threading.Thread(target=self._worker, args=('audio', self._audio, events, stop), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        features = [{} for _ in self.starts]
+        if self.text is not None:
+            for index, text in enumerate(self.text):
+                features[index]['text'] = pd.Series([text], name='transcription')
+        modalities = self.modalities()
+        finished = 0
+        try:
+            for index in range(len(self.starts)):
+                while any(modality not in features[index] for modality in modalities):
+                    event = events.get()
+                    if event[0] == 'error':
+                        raise event[2]
+                    if event[0] == 'features':
+                        _, modality, utterance, values = event
+                        features[utterance][modality] = values
+                    elif event[0] == 'end':
+                        finished += 1
+                        if finished == len(threads) and any(modality not in features[index] for modality in modalities):
+                            raise Exception('Sources finished before utterance {}'.format(index))
+                yield self.predict(index, features[index])
+                # Features of emitted utterances are not needed anymore
+                features[index] = None
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def _worker(self, modality, function, events, stop):
+        try:
+            function(events, stop)
+        except Exception as e:
+            logger.warning('Live {} analysis failed: {}'.format(modality, e))
+            events.put(('error', modality, e))
+        finally:
+            events.put(('end', modality))
+
+    def _video(self, events, stop):
+        """Running sums of the emotions of the frames of each utterance"""
+        analyzer = LiveVideoAnalyzer(self.classifier, self.video, poll=self.poll, timeout=self.timeout,
+                                     **self.video_options)
+        emotions = list(analyzer.emotions)
+        sums = np.zeros((len(self.starts), len(emotions)))
+        counts = np.zeros(len(self.starts))
+        pending = set(range(len(self.starts)))
+
+        def emit(index):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                means = sums[index] / counts[index]
+            row = pd.DataFrame([[self.starts[index], self.ends[index]] + list(means)],
+                               columns=['start', 'end'] + emotions)
+            events.put(('features', 'video', index, row))
+            pending.discard(index)
+
+        intervals = list(zip(self.starts, self.ends))
+        for record in analyzer.stream(intervals=intervals):
+            if stop.is_set():
+                return
+            timestamp = record['timestamp']
+            # Records without emotions only report that every frame before timestamp is classified
+            values = [record['emotions'][emotion] for emotion in emotions] if record['emotions'] is not None else None
+            for index in sorted(pending):
+                start, end = self.starts[index], self.ends[index]
+                if end is not None and timestamp >= end:
+                    emit(index)
+                elif start <= timestamp and values is not None:
+                    sums[index] += values
+                    counts[index] += 1
+            if not pending:
+                return
+        for index in sorted(pending):
+            emit(index)
+
+    def _audio(self, events, stop):
+        """Samples of the utterances not finished yet, whose features are extracted once they end"""
+        source = LiveAudio(self.audio, poll=self.poll, timeout=self.timeout)
+        extractor = AudioFeatures(**self.audio_options)
+        pending = set(range(len(self.starts)))
+        buffer, offset = np.empty(0), 0
+
+        def emit(index):
+            fs = source.fs
+            first = max(int(round(self.starts[index] * fs)) - offset, 0)
+            last = int(round(self.ends[index] * fs)) - offset if self.ends[index] is not None else len(buffer)
+            try:
+                values = extractor.segment(buffer[first:max(last, first)], fs)
+            except Exception as e:
+                logger.warning('Features from utterance {} cannot be extracted: {}'.format(index, e))
+                values = np.full(len(Selector.AUDIO_COLUMNS), np.nan, dtype=np.float32)
+            events.put(('features', 'audio', index, pd.DataFrame([values], columns=Selector.AUDIO_COLUMNS)))
+            pending.discard(index)
+
+        for chunk in source.chunks():
+            if stop.is_set():
+                return
+            buffer = np.concatenate([buffer, chunk])
+            position = (offset + len(buffer)) / source.fs
+            for index in sorted(pending):
+                if self.ends[index] is not None and position >= self.ends[index]:
+                    emit(index)
+            if not pending:
+                return
+            # Samples before the earliest pending utterance are not needed anymore
+            first = int(round(min(self.starts[index] for index in pending) * source.fs))
+            if first > offset:
+                buffer, offset = buffer[first - offset:], first
+        for index in sorted(pending):
+            emit(index)
+
+    def predict(self, index, features):
+        """Predictions of every analysis available for the features of an utterance"""
+        analyses = [
+            ('Text', ('text',), lambda ft: analyzer.text_batch_analyzer(ft['transcription'])),
+            ('Audio', ('audio',), analyzer.audio_batch_analyzer),
+            ('Video', ('video',), lambda ft: analyzer.video_batch_analyzer(ft.drop(columns=['start', 'end']))),
+            ('Text + Audio', ('text', 'audio'), lambda ft: analyzer.bimodal_analyzer(ft, ('text', 'audio'))),
+            ('Audio + Video', ('audio', 'video'), lambda ft: analyzer.bimodal_analyzer(ft, ('audio', 'video'))),
+            ('Video + Text', ('video', 'text'), lambda ft: analyzer.bimodal_analyzer(ft, ('video', 'text'))),
+            ('Multimodal', ('text', 'audio', 'video'), analyzer.multimodal)
+        ]
+        results = {}
+        with metrics.span('live'):
+            for name, modalities, function in analyses:
+                if all(modality in features for modality in modalities):
+                    ft = pd.concat([features[modality] for modality in modalities], axis=1)
+                    try:
+                        results[name] = function(ft)[0]
+                    except Exception as e:
+                        logger.warning('{} analysis of utterance {} failed: {}'.format(name, index, e))
+                        results[name] = None
+        return {'index': index, 'start': self.starts[index], 'end': self.ends[index], 'results': results}
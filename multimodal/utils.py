@@ -1,35 +1,131 @@
+import importlib
 import logging
+import os
 import re
 import string
 import sys
+import threading
+import types
 from contextlib import contextmanager
-from nltk.stem import SnowballStemmer
-from nltk.corpus import stopwords
-from nltk.tokenize.toktok import ToktokTokenizer
+from functools import lru_cache
 from time import time
+from .metrics import metrics
 
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# NLTK resources needed by the text pipelines
+NLTK_RESOURCES = {
+    'opinion_lexicon': 'corpora/opinion_lexicon',
+    'wordnet': 'corpora/wordnet',
+    'punkt': 'tokenizers/punkt',
+    'stopwords': 'corpora/stopwords'
+}
+
+
+class LazyModule(types.ModuleType):
+    """Module which is imported the first time one of its attributes is used"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attribute):
+        if self.__dict__['_module'] is None:
+            self.__dict__['_module'] = importlib.import_module(self.__name__)
+        return getattr(self.__dict__['_module'], attribute)
+
+
+def lazy_import(name):
+    """
+        Defer the import of a heavy module until it is used.
+
+        **Example**::
+
+            aT = lazy_import('pyAudioAnalysis.audioTrainTest')
+    """
+    return sys.modules[name] if name in sys.modules else LazyModule(name)
+
+
+def offline():
+    """Whether missing resources must not be downloaded (MULTIMODAL_OFFLINE environment variable)"""
+    return os.environ.get('MULTIMODAL_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+
+def nltk_resources(resources=None):
+    """Check that NLTK resources are installed, downloading them unless in offline mode"""
+    import nltk
+    for name, resource in (resources or NLTK_RESOURCES).items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            if offline():
+                raise LookupError('NLTK resource {} is not installed and offline mode is enabled'.format(name))
+            nltk.download(name)
+
+
+class SpanishPreprocessor:
+    """
+        Preprocessing of Spanish texts as seen in the lexical notebook.
+        Tokenizer, stemmer and stopwords are loaded once and stems are kept in a LRU cache.
+
+        :param cache_size: maximum number of stems kept in the cache
+    """
+
+    PUNCTUATION = frozenset(string.punctuation + '¡¿')
+    PAUSE = re.compile('^(-)|(-)$')
+
+    def __init__(self, cache_size=100000):
+        nltk_resources()
+        from nltk.stem import SnowballStemmer
+        from nltk.corpus import stopwords
+        from nltk.tokenize.toktok import ToktokTokenizer
+        self.tokenizer = ToktokTokenizer() # Spanish Tokenizer
+        self.stemmer = SnowballStemmer('spanish')
+        self.stoplist = frozenset(stopwords.words('spanish'))
+        self.stem = lru_cache(maxsize=cache_size)(self.stemmer.stem)
+
+    def tokenize(self, words):
+        """Lowercase, tokenize and stem a text, removing stopwords, punctuation and pauses"""
+        with metrics.span('tokenize'):
+            stems = [self.stem(t) for t in self.tokenizer.tokenize(words.lower())]
+            return [w.replace('/', '') for w in stems
+                    if w not in self.stoplist and w not in self.PUNCTUATION and not self.PAUSE.search(w)]
+
+    def tokenize_batch(self, texts):
+        """Tokenize a list of texts"""
+        return [self.tokenize(text) for text in texts]
+
+
+_preprocessor = None
+_preprocessor_lock = threading.Lock()
+
+
+def preprocessor():
+    """Process-wide SpanishPreprocessor"""
+    global _preprocessor
+    if _preprocessor is None:
+        with _preprocessor_lock:
+            if _preprocessor is None:
+                _preprocessor = SpanishPreprocessor()
+    return _preprocessor
+
 
 def custom_tokenizer(words):
     """Preprocessing tokens as seen in the lexical notebook"""
-    tokenizer = ToktokTokenizer() # Spanish Tokenizer
-    tokens = tokenizer.tokenize(words.lower())
-    snow = SnowballStemmer('spanish')
-    stems = [snow.stem(t) for t in tokens]
-    stoplist = stopwords.words('spanish')
-    stems_clean = [w for w in stems if w not in stoplist]
-    punctuation = set(string.punctuation + '¡¿')
-    stems_punct = [w for w in stems_clean if  w not in punctuation]
-    stems_pause = [w for w in stems_punct if not re.search('^(-)|(-)$', w)]
-    stems_clean = [re.sub('/', '', w) for w in stems_pause]
-
-    return stems_clean
-
-
-def progress_bar(iteration, total, prefix='', suffix='', decimals=2, bar_length=100):
-    """Print progress bar. Must be called in a loop"""
+    return preprocessor().tokenize(words)
+
+
+# Last time the progress bar was written
+_progress = {'time': 0.0}
+
+
+def progress_bar(iteration, total, prefix='', suffix='', decimals=2, bar_length=100, interval=0.5):
+    """Print progress bar. Must be called in a loop. It is written at most once every interval seconds"""
+    now = time()
+    if iteration != total-1 and now - _progress['time'] < interval:
+        return
+    _progress['time'] = now
     str_format = "{0:." + str(decimals) + "f}"
     if iteration == total-1:
         percents = str_format.format(float(100))
@@ -2,19 +2,45 @@ import cv2
 import logging
 import numpy as np
 import os
-import pandas as pd
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .checkpoint import Checkpoint
 from .fermodel import FERModel
+from .frame import FeatureFrame
+from .metrics import metrics
 from .utils import progress_bar
 
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(name)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Cascade classifiers cannot be shared between threads, so each thread keeps its own ones
+_cascades = threading.local()
+
 
 class ImageAnalyzer:
+    """
+        Face detection on images using a Haar cascade classifier.
+
+        :param classifier: path of the cascade classifier XML file
+        :param detection_scale: faces are detected on a copy of the image resized by this
+                                factor and mapped back to the original coordinates
+    """
 
-    def __init__(self, classifier, verbose=True, **kwargs):
+    def __init__(self, classifier, detection_scale=1.0, verbose=True, **kwargs):
         self.verbose = verbose
         self.classifier = classifier
+        self.detection_scale = detection_scale
+
+    @property
+    def cascade(self):
+        """Cascade classifier, built once per thread and classifier file"""
+        if not hasattr(_cascades, 'classifiers'):
+            _cascades.classifiers = {}
+        if self.classifier not in _cascades.classifiers:
+            _cascades.classifiers[self.classifier] = cv2.CascadeClassifier(self.classifier)
+        return _cascades.classifiers[self.classifier]
 
     def load(self, path):
         if os.path.isfile(path):
@@ -34,14 +60,32 @@ class ImageAnalyzer:
         y1, y2 = (y - y_off, y + height + y_off)
         return image[y1:y2, x1:x2]
 
-    def faces(self, image, scaleFactor=1.3, minNeighbors=5, minSize=(48, 48)):
-        cascade = cv2.CascadeClassifier(self.classifier)
+    def faces(self, image, scaleFactor=1.3, minNeighbors=5, minSize=(48, 48), scale=None):
+        scale = self.detection_scale if scale is None else scale
+        if scale < 1:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            minSize = tuple(max(1, int(round(size * scale))) for size in minSize)
         img_equalized = cv2.equalizeHist(image)
 
-        return cascade.detectMultiScale(img_equalized,
+        faces = self.cascade.detectMultiScale(img_equalized,
             scaleFactor = scaleFactor, minNeighbors = minNeighbors,
             minSize = minSize, flags = cv2.CASCADE_SCALE_IMAGE)
 
+        if scale < 1 and len(faces) > 0:
+            # Map boxes back to full-resolution coordinates
+            faces = np.round(np.asarray(faces) / scale).astype(int)
+        return faces
+
+    def facesAround(self, image, box, margin=0.5, **kwargs):
+        """Detect faces only in a region around a previous bounding box"""
+        x, y, width, height = box
+        x1, y1 = max(int(x - margin * width), 0), max(int(y - margin * height), 0)
+        x2, y2 = min(int(x + width * (1 + margin)), image.shape[1]), min(int(y + height * (1 + margin)), image.shape[0])
+        faces = self.faces(image[y1:y2, x1:x2], **kwargs)
+        if len(faces) > 0:
+            faces = np.asarray(faces) + [x1, y1, 0, 0]
+        return faces
+
     def drawBox(self, image, color=(0, 255, 255)):
         _color = np.asarray(color).astype(int).tolist()
         gray = self.toGray(image)
@@ -53,51 +97,332 @@ class ImageAnalyzer:
 
 
 class VideoAnalyzer(ImageAnalyzer):
+    """
+        Per-frame emotion recognition on a video file.
+
+        :param classifier: path of the cascade classifier XML file
+        :param file: video file in MP4 format
+        :param emotions: set of target emotions, it must be supported by FERModel
+        :param batch_size: number of face crops classified together
+        :param track_interval: if given, the whole frame is searched for a face only every
+                               track_interval frames or when the face is lost. In between,
+                               the face is searched only around its last position.
+        :param sample_rate: if given, frames are analyzed at this rate (frames per second)
+                            instead of at the frame rate of the video
+        :param threads: if greater than 1, frames are decoded in a separate thread and faces are
+                        detected in a pool of this number of threads while crops are classified
+        :param fer_threshold: if given, the emotions of the last classified face are reused for
+                              the next faces while they do not differ from it more than this
+                              threshold (see FERModel reuse_threshold)
+    """
 
-    def __init__(self, classifier, file, emotions=['anger', 'happiness', 'calm'], verbose=True, **kwargs):
+    def __init__(self, classifier, file, emotions=['anger', 'happiness', 'calm'], batch_size=32, track_interval=None,
+                 sample_rate=None, threads=1, fer_threshold=None, verbose=True, **kwargs):
+        self.file = file
+        self.target = self.open(file)
+        self.emotions = emotions
+        self.batch_size = max(int(batch_size), 1)
+        self.track_interval = track_interval
+        self.sample_rate = sample_rate
+        self.threads = max(int(threads or 1), 1)
+        self._box, self._tracked = None, 0
+        # Next frame, face box and tracked frames after the last record of a batch, to resume the analysis
+        self._resume = None
+        self.fer_threshold = fer_threshold
+        self.model = FERModel(self.emotions, verbose=verbose, reuse_threshold=fer_threshold)
+        self.verbose = verbose
+        super().__init__(classifier, verbose=verbose, **kwargs)
+
+    def open(self, file):
+        """Open the video file and read its size, frame rate and number of frames"""
         if os.path.isfile(file) and os.path.splitext(file)[1] == '.mp4':
             video = cv2.VideoCapture(file)
             self.width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
             self.height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
             self.fps = round(video.get(cv2.CAP_PROP_FPS))
             self.nframes = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-            self.target = video
+            return video
         else:
             raise Exception('File format do not supported!')
 
-        self.emotions = emotions
-        self.model = FERModel(self.emotions, verbose=verbose)
-        self.verbose = verbose
-        super().__init__(classifier, verbose=verbose, **kwargs)
+    def frames(self, intervals=None, from_frame=0):
+        """
+            Frames generator yielding (index, frame) tuples. Frames out of the intervals or
+            above the sample rate are skipped with grab() and never retrieved.
+
+            :param intervals: list of (start, end) tuples in seconds. An empty end means
+                              until the end of the video.
+            :param from_frame: first frame to read, e.g. to resume an analysis. Frames are
+                               sampled as if the previous ones had been read.
+        """
+        step = max(self.fps / self.sample_rate, 1) if self.sample_rate else 1
+        position = 0
+        for start, end in self.ranges(intervals):
+            if end is not None and end <= from_frame:
+                continue
+            sample = start
+            for skipped in range(start, max(start, from_frame)):
+                if skipped >= round(sample):
+                    sample += step
+            start = max(start, from_frame)
+            if start != position:
+                self.target.set(cv2.CAP_PROP_POS_FRAMES, start)
+                position = start
+            while end is None or position < end:
+                if position >= round(sample):
+                    with metrics.span('decode'):
+                        success, frame = self.target.read()
+                    if not success:
+                        return
+                    yield position, frame
+                    sample += step
+                else:
+                    with metrics.span('grab'):
+                        success = self.target.grab()
+                    if not success:
+                        return
+                position += 1
+
+    def first_frame(self, seconds):
+        """
+            Index of the first frame whose timestamp (index / fps) is not before the given seconds,
+            the same comparison used to synchronize the frames with the utterances.
+        """
+        index = int(np.ceil(seconds * self.fps))
+        # seconds * fps may be rounded past an integer, e.g. 2.2 * 25 = 55.00000000000001
+        while (index - 1) / self.fps >= seconds:
+            index -= 1
+        while index / self.fps < seconds:
+            index += 1
+        return index
 
-    def frames(self):
-        """Frames generator"""
-        success, frame = self.target.read()
-        while success:
-            yield frame
-            success, frame = self.target.read()
+    def ranges(self, intervals=None):
+        """Sorted and merged (start, end) frame ranges from intervals in seconds"""
+        if intervals is None:
+            return [(0, None)]
+        ranges = []
+        for start, end in sorted(intervals, key=lambda interval: interval[0]):
+            start = max(self.first_frame(start), 0)
+            end = self.first_frame(end) if end and not np.isnan(end) else None
+            if ranges and (ranges[-1][1] is None or start <= ranges[-1][1]):
+                last = ranges[-1][1]
+                ranges[-1] = (ranges[-1][0], None if last is None or end is None else max(last, end))
+            else:
+                ranges.append((start, end))
+        return ranges
 
-    def analyze(self, **kwargs):
-        self.results = []
-        for frame in self.frames():
+    @property
+    def columns(self):
+        """Columns of the per-frame results"""
+        return list(self.emotions) + ['timestamp']
+
+    def stream(self, keep_frames=False, intervals=None, from_frame=0):
+        """
+            Per-frame emotion records generator. Face crops are classified in batches of
+            self.batch_size, so only the frames of the current batch are kept in memory
+            unless keep_frames is set.
+
+            Sources which report the end of the intervals (e.g. LiveVideoAnalyzer) yield
+            (index, None) from frames: the current batch is classified at once, and a record
+            with the timestamp of that frame and no emotions follows its records.
+
+            :param keep_frames: if true, every record includes the raw frame
+            :param intervals: list of (start, end) tuples in seconds to analyze
+            :param from_frame: first frame to analyze. If given, the tracked face is not reset.
+        """
+        if not from_frame:
+            self._box, self._tracked = None, 0
+            self.model.reference = None
+        if self.threads > 1:
+            yield from self._pipeline(keep_frames, intervals, from_frame)
+            return
+        batch = []
+        for index, frame in self.frames(intervals, from_frame):
+            if frame is None:
+                yield from self._predict(batch, keep_frames)
+                batch = []
+                yield {'emotions': None, 'timestamp': index / self.fps}
+                continue
             if (self.verbose):
-                progress_bar(len(self.results), self.nframes, prefix='Progress: ', bar_length=90)
-            gray = self.toGray(frame)
-            faces = self.faces(gray)
-            # Get face if it is detected else whole frame
-            face = faces[0] if len(faces) > 0 else (0, 0, frame.shape[1], frame.shape[0])
-            prediction = self.model.predict(self.crop(frame, face, x_off=0, y_off=0))
-            self.results.append({
-                'frame': frame,
+                progress_bar(index, self.nframes, prefix='Progress: ', bar_length=90)
+            crop = self.detect(frame)
+            batch.append((index, frame, crop, (self._box, self._tracked)))
+            if len(batch) >= self.batch_size:
+                yield from self._predict(batch, keep_frames)
+                batch = []
+        yield from self._predict(batch, keep_frames)
+
+    def _pipeline(self, keep_frames=False, intervals=None, from_frame=0):
+        """
+            Same records as stream, with frames decoded in a separate thread and faces detected
+            in a pool of threads while crops are classified in this one. Records keep the order
+            of the frames and only a bounded number of frames is in flight.
+        """
+        decoded = queue.Queue(maxsize=2 * self.batch_size)
+        stop = threading.Event()
+        end = object()
+        # Spans of the decoding and detection threads are nested in the span of this one
+        parent = metrics.current()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    decoded.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def decode():
+            try:
+                with metrics.attach(parent):
+                    for item in self.frames(intervals, from_frame):
+                        put(item)
+                        if stop.is_set():
+                            return
+            except Exception as e:
+                put(e)
+            finally:
+                put(end)
+
+        def detect(frame):
+            with metrics.attach(parent):
+                # Faces are tracked only with a single detection thread, so the state is the one of this frame
+                return self.detect(frame), (self._box, self._tracked)
+
+        decoder = threading.Thread(target=decode, daemon=True)
+        decoder.start()
+        # Tracking depends on the previous frame, so detections must run one after another
+        workers = 1 if self.track_interval else self.threads
+        pending, batch, finished = deque(), [], False
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                while not finished or pending:
+                    while not finished and len(pending) < 2 * workers + self.batch_size:
+                        item = decoded.get()
+                        if item is end:
+                            finished = True
+                        elif isinstance(item, Exception):
+                            raise item
+                        else:
+                            index, frame = item
+                            future = executor.submit(detect, frame) if frame is not None else None
+                            pending.append((index, frame, future))
+                    if pending:
+                        index, frame, future = pending.popleft()
+                        if frame is None:
+                            yield from self._predict(batch, keep_frames)
+                            batch = []
+                            yield {'emotions': None, 'timestamp': index / self.fps}
+                            continue
+                        if (self.verbose):
+                            progress_bar(index, self.nframes, prefix='Progress: ', bar_length=90)
+                        batch.append((index, frame) + future.result())
+                        if len(batch) >= self.batch_size:
+                            yield from self._predict(batch, keep_frames)
+                            batch = []
+                yield from self._predict(batch, keep_frames)
+        finally:
+            stop.set()
+            decoder.join()
+
+    def detect(self, frame):
+        """Crop of the face in a frame, or the whole frame if no face is found"""
+        with metrics.span('detect'):
+            box = self.locate(self.toGray(frame))
+        with metrics.span('crop'):
+            return self.crop(frame, box, x_off=0, y_off=0)
+
+    def locate(self, gray):
+        """Bounding box of the face in a grayscale frame, or the whole frame if no face is found"""
+        if self.track_interval and self._box is not None and self._tracked < self.track_interval:
+            faces = self.facesAround(gray, self._box)
+            if len(faces) > 0:
+                # Follow the face closest to the last known position
+                x, y, _, _ = self._box
+                self._box = min(faces, key=lambda face: abs(face[0] - x) + abs(face[1] - y))
+                self._tracked += 1
+                return self._box
+        faces = self.faces(gray)
+        self._box, self._tracked = (faces[0], 1) if len(faces) > 0 else (None, 0)
+        # Get face if it is detected else whole frame
+        return self._box if self._box is not None else (0, 0, gray.shape[1], gray.shape[0])
+
+    def _predict(self, batch, keep_frames=False):
+        """Classify a batch of (index, frame, crop, tracking state) tuples and yield their records"""
+        if not batch:
+            return
+        predictions = self.model.predict_batch([crop for _, _, crop, _ in batch])
+        for position, ((index, frame, _, (box, tracked)), prediction) in enumerate(zip(batch, predictions)):
+            record = {
                 'emotions': { emotion:  value/sum(prediction) for emotion, value in zip(self.emotions, prediction) },
-                'timestamp': len(self.results) / self.fps
-            })
+                'timestamp': index / self.fps
+            }
+            if keep_frames:
+                record['frame'] = frame
+            # Batches must not change when an analysis is resumed, so it is resumed only after a whole batch
+            self._resume = (index + 1, box, tracked) if position == len(batch) - 1 else None
+            yield record
+
+    def analyze(self, keep_frames=False, intervals=None, checkpoint=None, **kwargs):
+        """
+            Analyze the video and store the per-frame emotions in self.results, a FeatureFrame
+            preallocated for every frame with the emotions as columns and the timestamp as index.
+
+            :param keep_frames: if true, raw frames are kept in self.images (e.g. for drawBox)
+            :param intervals: list of (start, end) tuples in seconds to analyze, the whole video by default
+            :param checkpoint: Checkpoint where the results are saved periodically. If it contains the
+                               results of an interrupted analysis of the same video with the same
+                               options, the analysis resumes after its last frame.
+        """
+        if keep_frames and checkpoint is not None:
+            raise Exception('Frames cannot be kept when the analysis is checkpointed')
+        emotions = list(self.emotions)
+        # Frame count reported by some containers is only an estimation, the frame grows if needed
+        self.results = FeatureFrame(emotions, capacity=self.nframes, index='timestamp')
+        self.images = [] if keep_frames else None
+        from_frame = 0
+        if checkpoint is not None:
+            key = Checkpoint.key(self.file, kind='video', emotions=emotions, batch_size=self.batch_size,
+                                 track_interval=self.track_interval, sample_rate=self.sample_rate,
+                                 detection_scale=self.detection_scale, fer_threshold=self.fer_threshold,
+                                 intervals=intervals)
+            state = checkpoint.load('video', key)
+            if state is not None:
+                from_frame = int(state['position'])
+                self.results = FeatureFrame(emotions, rows=len(state['values']), capacity=self.nframes,
+                                            index='timestamp')
+                self.results.values[:] = state['values']
+                self.results.index[:] = state['timestamps']
+                self._box = state['box'] if len(state['box']) else None
+                self._tracked = int(state['tracked'])
+                if len(state['fer_signature']):
+                    self.model.reference = (state['fer_signature'], state['fer_prediction'])
+                logger.info('Resuming the analysis of {} from frame {}'.format(self.file, from_frame))
+        self._resume = (from_frame, self._box, self._tracked) if from_frame else (0, None, 0)
+        with metrics.span('video') as span:
+            for record in self.stream(keep_frames=keep_frames, intervals=intervals, from_frame=from_frame):
+                self.results.append([record['emotions'][emotion] for emotion in emotions], record['timestamp'])
+                if keep_frames:
+                    self.images.append(record['frame'])
+                if checkpoint is not None and self._resume is not None and checkpoint.due():
+                    self._checkpoint(checkpoint, key)
+            # Rate of the span is the number of analyzed frames per second
+            span.items = len(self.results)
+        if checkpoint is not None:
+            self._checkpoint(checkpoint, key)
+        if self.model.hit_rate() is not None:
+            logger.info('FER predictions reused for {:.1%} of the faces'.format(self.model.hit_rate()))
+        self.results.trim()
         return self
 
+    def _checkpoint(self, checkpoint, key):
+        """Save the results up to the end of the last batch and the state needed to resume after it"""
+        position, box, tracked = self._resume
+        # Prediction reused by the FER model for the next batch
+        signature, prediction = self.model.reference if self.model.reference is not None else (np.empty(0), np.empty(0))
+        checkpoint.update('video', key, values=self.results.values, timestamps=self.results.index, position=position,
+                          box=box if box is not None else np.empty(0, dtype=int), tracked=tracked,
+                          fer_signature=signature, fer_prediction=prediction)
+
     def toDataFrame(self):
-        _images = self.results.copy()
-        for i in range(len(_images)):
-            _images[i] = dict(_images[i], **_images[i]['emotions'])
-            del _images[i]['emotions']
-            del _images[i]['frame']
-        return pd.DataFrame(_images)
+        return self.results.to_frame()
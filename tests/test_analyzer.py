@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+from multimodal import analyzer
+from multimodal.registry import registry
+from multimodal.selector import Selector
+
+
+class FakeModel:
+    """Model which records the features it is asked to predict"""
+
+    def __init__(self):
+        self.features = None
+
+    def predict(self, features):
+        self.features = features
+        return np.zeros(len(features))
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(registry, 'get', lambda name: model)
+    return model
+
+
+def test_video_features_in_training_order(model):
+    # Named columns are reordered, whatever the order of the emotions of the analyzer
+    df = pd.DataFrame([[0.1, 0.2, 0.7]], columns=['anger', 'calm', 'happiness'])
+    analyzer.video_batch_analyzer(df)
+    assert list(model.features.columns) == Selector.VIDEO_MODEL_COLUMNS
+    np.testing.assert_allclose(model.features.values, [[0.1, 0.7, 0.2]], rtol=1e-6)
+
+
+def test_video_ndarray_in_training_order(model):
+    analyzer.video_batch_analyzer(np.array([0.1, 0.7, 0.2]))
+    assert list(model.features.columns) == Selector.VIDEO_MODEL_COLUMNS
+    assert model.features.values.tolist() == [[0.1, 0.7, 0.2]]
+
+
+def test_video_series_list(model):
+    rows = [pd.Series({'anger': 0.1, 'happiness': 0.7, 'calm': 0.2})] * 2
+    assert len(analyzer.video_batch_analyzer(rows)) == 2
+    assert list(model.features.columns) == Selector.VIDEO_MODEL_COLUMNS
+
+
+def test_audio_ndarray_list(model):
+    rows = [np.arange(len(Selector.AUDIO_COLUMNS), dtype=np.float32)] * 3
+    assert len(analyzer.audio_batch_analyzer(rows)) == 3
+    assert list(model.features.columns) == Selector.AUDIO_COLUMNS
+    assert list(Selector.audio(model.features).values[0]) == list(rows[0])
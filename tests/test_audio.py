@@ -0,0 +1,58 @@
+import numpy as np
+import os
+import pytest
+from scipy.io import wavfile
+from multimodal import audio
+from multimodal.features import AudioFeatures
+
+# Reference implementation of the features the audio models were trained with, pinned in requirements.txt
+from pyAudioAnalysis import audioFeatureExtraction, audioTrainTest
+
+MODELS = os.path.join(os.path.dirname(audio.__file__), 'models')
+
+RATES = [8000, 16000, 22050, 44100]
+
+
+def signal(fs, seconds=3.0, seed=0, offset=0):
+    """Modulated tone with harmonics and noise around a DC offset, as 16-bit samples"""
+    rng = np.random.RandomState(seed)
+    t = np.arange(int(fs * seconds)) / fs
+    x = 6000 * np.sin(2 * np.pi * 220 * t) * np.sin(2 * np.pi * 0.5 * t) + 1500 * np.sin(2 * np.pi * 660 * t)
+    return (x + 2000 * rng.randn(len(t)) + offset).astype(np.int16)
+
+
+@pytest.mark.parametrize('fs', RATES)
+@pytest.mark.parametrize('offset', [0, 3000])
+def test_short_term_features(fs, offset):
+    x = signal(fs, offset=offset)
+    expected, names = audioFeatureExtraction.stFeatureExtraction(x, fs, 0.050 * fs, 0.025 * fs)
+    # Small blocks check that the spectral flux is carried over between blocks
+    features, _ = audio.short_term_features(x, fs, 0.050 * fs, 0.025 * fs, block=37)
+    assert features.shape == expected.T.shape
+    assert list(names) == audio.NAMES
+    np.testing.assert_allclose(features, expected.T, rtol=1e-6, atol=1e-9)
+
+
+@pytest.mark.parametrize('fs', RATES)
+@pytest.mark.parametrize('offset', [0, 3000])
+def test_mid_term_features(fs, offset):
+    x = signal(fs, seconds=5.0, seed=1, offset=offset)
+    window, step = round(0.05 * fs), round(0.05 * fs)
+    mid, short, _ = audioFeatureExtraction.mtFeatureExtraction(x, fs, 1.0 * fs, 1.0 * fs, window, step)
+    features, short_features = audio.mid_term_features(x, fs, 1.0 * fs, 1.0 * fs, window, step)
+    np.testing.assert_allclose(short_features, short.T, rtol=1e-6, atol=1e-9)
+    # Long-term average of the mid-term features, as aT.fileRegression computes it
+    np.testing.assert_allclose(features, mid.mean(axis=1), rtol=1e-6, atol=1e-9)
+
+
+@pytest.mark.parametrize('extractor', AudioFeatures.EXTRACTORS)
+def test_regression(tmp_path, extractor):
+    file = str(tmp_path / 'utterance.wav')
+    wavfile.write(file, 16000, signal(16000, seconds=5.0, seed=2, offset=500))
+    values, names = audioTrainTest.fileRegression(file, os.path.join(MODELS, 'svmSpeechEmotion'), 'svm')
+    expected = dict(zip(names, values))
+    extractor = AudioFeatures(extractor=extractor)
+    Fs, x = extractor.read(file)
+    arousal, valence = extractor.regression(x, Fs)
+    assert arousal == pytest.approx(expected['arousal'], rel=1e-6)
+    assert valence == pytest.approx(expected['valence'], rel=1e-6)
@@ -0,0 +1,39 @@
+import pytest
+from multimodal import batch, pipeline
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    """Worker process without the video models, which records the modalities warmed up"""
+    calls = []
+
+    def warmup(modalities):
+        calls.append(list(modalities))
+        if 'video' in modalities:
+            raise ImportError('No module named tensorflow')
+
+    monkeypatch.setattr(batch, '_loaded', set())
+    monkeypatch.setattr(batch, '_errors', {})
+    monkeypatch.setattr(pipeline, 'warmup', warmup)
+    monkeypatch.setattr(pipeline, 'load_sources', lambda **sources: dict(sources, bounds=None))
+    monkeypatch.setattr(pipeline, 'analyze', lambda **options: {'Text': [1.0]})
+    return calls
+
+
+def item(id, **sources):
+    return dict({source: None for source in batch.SOURCES}, id=id, **sources)
+
+
+def test_items_fail_only_without_their_models(worker):
+    items = [item('1', text='1.csv'), item('2', video='2.mp4'), item('3', text='3.csv', audio_dir='3'),
+             item('4', video='4.mp4')]
+    records = [batch.analyze_item(item, {}) for item in items]
+    assert [record['status'] for record in records] == ['done', 'failed', 'done', 'failed']
+    assert 'tensorflow' in records[3]['error']
+    # Models are loaded once per process, and a failed warmup is not tried again
+    assert worker == [['text'], ['video'], ['audio']]
+
+
+def test_modalities():
+    assert batch.modalities(item('1', bounds='1.csv', text='1.csv', audio_dir='1')) == ['text', 'audio']
+    assert batch.modalities(item('2', audio=['2.wav'], video='2.mp4')) == ['audio', 'video']
@@ -0,0 +1,112 @@
+import cv2
+import numpy as np
+import os
+import pandas as pd
+import pytest
+from scipy.io import wavfile
+from multimodal import features, video
+from multimodal.checkpoint import Checkpoint
+
+CLASSIFIER = os.path.join(os.path.dirname(video.__file__), 'models', 'haarcascade_frontalface_default.xml')
+
+
+class Interrupted(Exception):
+    pass
+
+
+class FakeFERModel:
+    """Deterministic emotions computed from the crops, which can be interrupted after some batches"""
+
+    batches = 0
+    limit = None
+
+    def __init__(self, *args, **kwargs):
+        self.reference = None
+
+    def predict_batch(self, images):
+        FakeFERModel.batches += 1
+        if FakeFERModel.limit is not None and FakeFERModel.batches > FakeFERModel.limit:
+            raise Interrupted()
+        return np.array([[1.0 + image.mean() / 255, 1.0 + image.std() / 255, 1.0] for image in images])
+
+    def hit_rate(self):
+        return None
+
+
+@pytest.fixture
+def mp4(tmp_path):
+    file = str(tmp_path / 'video.mp4')
+    rng = np.random.RandomState(0)
+    writer = cv2.VideoWriter(file, cv2.VideoWriter_fourcc(*'mp4v'), 25, (96, 72))
+    for _ in range(100):
+        writer.write(rng.randint(0, 255, (72, 96, 3)).astype(np.uint8))
+    writer.release()
+    return file
+
+
+@pytest.fixture
+def fer(monkeypatch):
+    monkeypatch.setattr(video, 'FERModel', FakeFERModel)
+    FakeFERModel.batches, FakeFERModel.limit = 0, None
+    yield FakeFERModel
+    FakeFERModel.limit = None
+
+
+def resume(run):
+    """Run until it is not interrupted, returning its result and the number of runs"""
+    runs = 0
+    while True:
+        runs += 1
+        try:
+            return run(), runs
+        except Interrupted:
+            pass
+
+
+@pytest.mark.parametrize('options, intervals', [
+    ({'batch_size': 7}, None),
+    ({'batch_size': 5, 'track_interval': 3, 'sample_rate': 10}, [(0.5, 1.7), (2.3, None)]),
+    ({'batch_size': 4, 'threads': 2}, [(1.0, 3.0)])
+])
+def test_video_resumed_as_uninterrupted(mp4, fer, tmp_path, options, intervals):
+    expected = video.VideoAnalyzer(CLASSIFIER, mp4, verbose=False, **options).analyze(intervals=intervals).results
+
+    file = str(tmp_path / 'checkpoint.npz')
+
+    def run():
+        fer.batches, fer.limit = 0, 2
+        analyzer = video.VideoAnalyzer(CLASSIFIER, mp4, verbose=False, **options)
+        return analyzer.analyze(intervals=intervals, checkpoint=Checkpoint(file, interval=0)).results
+
+    results, runs = resume(run)
+    assert runs > 1
+    assert np.array_equal(results.values, expected.values)
+    assert np.array_equal(results.index, expected.index)
+
+
+def test_audio_resumed_as_uninterrupted(monkeypatch, tmp_path):
+    fs = 16000
+    rng = np.random.RandomState(0)
+    file = str(tmp_path / 'session.wav')
+    wavfile.write(file, fs, (3000 * rng.randn(fs * 5)).astype(np.int16))
+    bounds = pd.DataFrame({'#starttime': [0.0, 1.0, 2.0, 3.0, 4.0], '#endtime': [1.0, 2.0, 3.0, 4.0, np.nan]})
+    monkeypatch.setattr(features.AudioFeatures, 'regression', lambda self, x, Fs: (0.1, 0.2))
+    expected = features.BimodalFeatures(bounds).run_audio(file).audio
+
+    extract = features.audio_segment_features
+    calls = {'count': 0}
+
+    def interrupted(*args):
+        calls['count'] += 1
+        if calls['count'] % 3 == 0:
+            raise Interrupted()
+        return extract(*args)
+
+    monkeypatch.setattr(features, 'audio_segment_features', interrupted)
+    checkpoint = str(tmp_path / 'checkpoint.npz')
+    results, runs = resume(lambda: features.BimodalFeatures(bounds, checkpoint=Checkpoint(checkpoint, interval=0))
+                           .run_audio(file).audio)
+    assert runs > 1
+    # Utterances extracted before an interruption are not extracted again
+    assert calls['count'] - (runs - 1) == len(bounds)
+    assert np.array_equal(results.values, expected.values)
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+import types
+from scipy.io import wavfile
+from multimodal import features
+from multimodal.cache import FeatureCache
+from multimodal.frame import FeatureFrame
+from multimodal.registry import ModelRegistry
+from multimodal.selector import Selector
+
+REGRESSION = features.AudioFeatures.regression
+
+
+@pytest.fixture
+def session(tmp_path):
+    """Session WAV file with three utterances of noise at different levels"""
+    fs = 16000
+    rng = np.random.RandomState(0)
+    x = np.concatenate([(level * rng.randn(fs * 2)).astype(np.int16) for level in (1000, 3000, 6000)])
+    file = str(tmp_path / 'session.wav')
+    wavfile.write(file, fs, x)
+    bounds = pd.DataFrame({'#starttime': [0.0, 2.0, 4.0], '#endtime': [2.0, 4.0, 6.0]})
+    return file, bounds
+
+
+@pytest.fixture(autouse=True)
+def regression(monkeypatch):
+    # Arousal and valence need the SVM models, which are not the subject of these tests
+    monkeypatch.setattr(features.AudioFeatures, 'regression', lambda self, x, Fs: (0.1, 0.2))
+
+
+def test_session_features_with_cache(session, tmp_path):
+    file, bounds = session
+    cache = FeatureCache(str(tmp_path / 'cache'))
+    extracted = features.BimodalFeatures(bounds, cache=cache).run_audio(file).audio
+    cached = features.BimodalFeatures(bounds, cache=cache).run_audio(file).audio
+    assert extracted.columns == Selector.AUDIO_COLUMNS
+    assert len(extracted) == len(bounds)
+    assert np.array_equal(extracted.values, cached.values)
+    assert len(cache.entries()) == 1
+
+
+def test_cache_stores_float32_features(tmp_path):
+    cache = FeatureCache(str(tmp_path / 'cache'))
+    frame = FeatureFrame(['anger', 'calm'], index='timestamp')
+    frame.append([0.1, 0.9], 1 / 3)
+    cache.save_frame('entry', frame)
+    with np.load(cache._path('entry')) as data:
+        assert data['c0'].dtype == np.float32 and data['c2'].dtype == np.float64
+    loaded = cache.load_frame('entry', index='timestamp')
+    assert np.array_equal(loaded.values, frame.values)
+    assert loaded.index.tolist() == [1 / 3]
+
+
+def test_cache_key_changes_with_model_files(session, tmp_path):
+    file, _ = session
+    cache = FeatureCache(str(tmp_path / 'cache'))
+    model = tmp_path / 'model'
+    model.write_bytes(b'model')
+    key = cache.key(file, models=[str(model)], kind='audio')
+    assert cache.key(file, models=[str(model)], kind='audio') == key
+    model.write_bytes(b'retrained model')
+    assert cache.key(file, models=[str(model)], kind='audio') != key
+
+
+def test_synchronize_feature_frame():
+    frame = FeatureFrame(['anger', 'happiness', 'calm'], index='timestamp')
+    for index in range(100):
+        frame.append([index, 2 * index, 1], index / 25)
+    vf = features.VideoFeatures()
+    expected = vf.synchronize(frame.to_frame(), 2.2, 2.4)
+    result = vf.synchronize(frame, 2.2, 2.4)
+    assert list(result.index) == ['start', 'end', 'anger', 'happiness', 'calm']
+    assert result.tolist() == pytest.approx(expected.tolist())
+    assert result['anger'] == pytest.approx(np.mean(range(55, 60)))
+
+
+@pytest.mark.parametrize('module', [
+    types.SimpleNamespace(loadSVModel=lambda file, regression: (file, regression)),
+    types.SimpleNamespace(load_model=lambda file, regression: (file, regression))
+])
+def test_regression_model_loader(monkeypatch, module):
+    # pyAudioAnalysis 0.2 renamed loadSVModel to load_model
+    monkeypatch.setattr(features, 'aT', module)
+    assert features.load_regression_model('svmSpeechEmotion_arousal') == ('svmSpeechEmotion_arousal', True)
+
+
+def test_regression_model_errors_are_raised(monkeypatch):
+    def load():
+        raise AttributeError('load_model')
+
+    monkeypatch.setattr(features, 'registry', ModelRegistry({'arousal': load, 'valence': load}))
+    models = {'arousal': 'arousal', 'valence': 'valence'}
+    monkeypatch.setattr(features.AudioFeatures, 'regression_models', staticmethod(lambda: models))
+    with pytest.raises(AttributeError):
+        REGRESSION(features.AudioFeatures(), np.zeros(16000), 16000)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from contextlib import contextmanager
+from multimodal.fermodel import FERModel
+from multimodal.metrics import metrics
+
+
+class FakeNetwork:
+    """Network which predicts the mean intensity of each image, recording every inferred image"""
+
+    def __init__(self):
+        self.inferred = []
+
+    def predict(self, batch, batch_size=None):
+        self.inferred.extend(batch)
+        means = batch.mean(axis=(1, 2, 3))
+        return np.stack([means, 255 - means, np.ones(len(batch))], axis=1)
+
+    @contextmanager
+    def as_default(self):
+        yield
+
+
+@pytest.fixture
+def model(monkeypatch):
+    network = FakeNetwork()
+
+    def initialize(self):
+        self.model, self.emotion_map, self.graph = network, {}, network
+
+    monkeypatch.setattr(FERModel, '_initialize_model', initialize)
+    return FERModel(['anger', 'happiness', 'calm'], reuse_threshold=2.0)
+
+
+def crop(level, noise=0):
+    """48x48 grayscale crop of the given intensity, with a few pixels changed by noise"""
+    image = np.full((48, 48), level, dtype=np.uint8)
+    image[::8, ::8] += noise
+    return image
+
+
+def test_near_identical_crops_reuse_the_last_prediction(model):
+    hits, misses = metrics.counter('fer_cache_hits'), metrics.counter('fer_cache_misses')
+    images = [crop(100), crop(100, 1), crop(100, 3), crop(200), crop(200, 2), crop(100)]
+    predictions = model.predict_batch(images)
+    # Only the first crop and the crops which clearly differ from the last inferred one are classified
+    assert len(model.model.inferred) == 3
+    assert [image.mean() for image in model.model.inferred] == [100, 200, 100]
+    assert np.array_equal(predictions[1], predictions[0]) and np.array_equal(predictions[2], predictions[0])
+    assert np.array_equal(predictions[4], predictions[3])
+    assert not np.array_equal(predictions[3], predictions[0])
+    assert (model.hits, model.misses) == (3, 3)
+    assert model.hit_rate() == 0.5
+    assert metrics.counter('fer_cache_hits') - hits == 3
+    assert metrics.counter('fer_cache_misses') - misses == 3
+
+
+def test_reuse_across_batches_and_reset_between_videos(model):
+    first = model.predict_batch([crop(100), crop(200)])
+    # The reference is the last inferred crop of the previous batch
+    assert np.array_equal(model.predict_batch([crop(200, 1)])[0], first[1])
+    assert len(model.model.inferred) == 2
+    # VideoAnalyzer resets the reference at the start of each video
+    model.reference = None
+    model.predict_batch([crop(200, 1)])
+    assert len(model.model.inferred) == 3
+    assert (model.hits, model.misses) == (1, 3)
+
+
+def test_no_reuse_without_threshold(model):
+    model.reuse_threshold = None
+    model.predict_batch([crop(100)] * 4)
+    assert len(model.model.inferred) == 4
+    assert model.hit_rate() is None
@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+import os
+import pytest
+from multimodal import video
+from multimodal.features import VideoFeatures
+from multimodal.stream import LiveVideoAnalyzer
+from multimodal.video import VideoAnalyzer
+
+CLASSIFIER = os.path.join(os.path.dirname(video.__file__), 'models', 'haarcascade_frontalface_default.xml')
+
+
+class FakeFERModel:
+    """Same emotions for every crop, recording the size of each batch"""
+
+    batches = []
+
+    def __init__(self, *args, **kwargs):
+        self.reference = None
+
+    def predict_batch(self, images):
+        FakeFERModel.batches.append(len(images))
+        return np.ones((len(images), 3))
+
+    def hit_rate(self):
+        return None
+
+
+@pytest.fixture
+def mp4(tmp_path, monkeypatch):
+    monkeypatch.setattr(video, 'FERModel', FakeFERModel)
+    FakeFERModel.batches = []
+    file = str(tmp_path / 'video.mp4')
+    writer = cv2.VideoWriter(file, cv2.VideoWriter_fourcc(*'mp4v'), 25, (96, 72))
+    for index in range(100):
+        writer.write(np.full((72, 96, 3), index, dtype=np.uint8))
+    writer.release()
+    return file
+
+
+@pytest.fixture
+def analyzer():
+    # Only the frame rate is needed to compute the frame ranges
+    analyzer = VideoAnalyzer.__new__(VideoAnalyzer)
+    analyzer.fps = 25
+    return analyzer
+
+
+def test_ranges_include_boundary_frames(analyzer):
+    # 2.2 * 25 is 55.00000000000001, but frame 55 has timestamp 2.2
+    assert analyzer.ranges([(2.2, 4.8), (0.3, 0.7)]) == [(8, 18), (55, 120)]
+    assert analyzer.ranges([(-1, None)]) == [(0, None)]
+
+
+@pytest.mark.parametrize('fps', [24, 25, 30, 60])
+def test_ranges_match_synchronize(analyzer, fps):
+    analyzer.fps = fps
+    timestamps = np.arange(10 * fps) / fps
+    starts = np.round(np.arange(0, 9, 0.1), 1)
+    ends = starts + 0.5
+    frames = np.arange(len(timestamps), dtype=np.float64)[:, None]
+    # The mean index of the frames synchronized with an utterance is the middle of its range
+    means = VideoFeatures.means(timestamps, frames, starts, ends)[:, 0]
+    for start, end, mean in zip(starts, ends, means):
+        (first, last), = analyzer.ranges([(start, end)])
+        assert mean == (first + last - 1) / 2
+
+
+@pytest.mark.parametrize('threads', [1, 2])
+def test_live_batch_classified_at_the_end_of_each_interval(mp4, threads):
+    analyzer = LiveVideoAnalyzer(CLASSIFIER, mp4, follow=False, batch_size=32, threads=threads)
+    records = list(analyzer.stream(intervals=[(0.2, 0.6), (0.6, 1.0), (3.0, 3.4)]))
+    # The end of the first two intervals is reported as soon as it is read, before the gap
+    marks = [index for index, record in enumerate(records) if record['emotions'] is None]
+    assert marks == [10, 21]
+    assert [records[index]['timestamp'] for index in marks] == [0.6, 1.0]
+    assert [record['timestamp'] for record in records if record['emotions'] is not None] == \
+        [index / 25 for index in list(range(5, 25)) + list(range(75, 85))]
+    assert FakeFERModel.batches == [10, 10, 10]